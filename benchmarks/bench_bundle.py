@@ -0,0 +1,91 @@
+"""# benchmark importing notebooks from a bundle
+
+compares importing a package of notebooks from a directory, with a warm bytecode cache,
+to importing it from a bundle, counting the files opened by each.
+
+    python benchmarks/bench_bundle.py
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+
+from importnb import Notebook
+from importnb.bundle import build_bundle, bundles
+from importnb.compileall import compile_dir
+
+#: the number of notebooks, and of code cells in each notebook.
+NOTEBOOKS, CELLS = 256, 50
+PACKAGE = "bench_bundle_pkg"
+
+#: the number of each audit event counted.
+EVENTS: Counter[str] = Counter()
+
+
+def count_opens(event: str, args: tuple[object, ...]) -> None:
+    if event == "open":
+        EVENTS[event] += 1
+
+
+def make_package(directory: Path) -> None:
+    package = directory / PACKAGE
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    for i in range(NOTEBOOKS):
+        cells = [
+            {
+                "cell_type": "code",
+                "execution_count": j,
+                "metadata": {},
+                "outputs": [],
+                "source": [f"def f{j}(x):\n", f"    return x + {j}\n"],
+            }
+            for j in range(CELLS)
+        ]
+        path = package / f"nb_{i}.ipynb"
+        path.write_text(json.dumps({"cells": cells, "metadata": {}}, indent=1), encoding="utf-8")
+
+
+def import_all() -> tuple[float, int]:
+    for name in [name for name in sys.modules if name.startswith(PACKAGE)]:
+        del sys.modules[name]
+    sys.path_importer_cache.clear()
+    Notebook.cache_clear()
+    EVENTS.clear()
+    start = perf_counter()
+    for i in range(NOTEBOOKS):
+        __import__(f"{PACKAGE}.nb_{i}")
+    return perf_counter() - start, EVENTS["open"]
+
+
+def main() -> None:
+    sys.addaudithook(count_opens)
+    with tempfile.TemporaryDirectory() as tmp:
+        tree = Path(tmp, "tree")
+        tree.mkdir()
+        make_package(tree)
+        for compiled in compile_dir([tree], workers=1):
+            assert not compiled.error, compiled.error
+        bundle = Path(tmp, "bundle.zip")
+        build_bundle([tree], bundle)
+
+        sys.path.insert(0, str(tree))
+        with Notebook():
+            seconds, count = import_all()
+        print(f"{'directory':>10}: {seconds:8.3f} s {count:6} opens")
+        sys.path.remove(str(tree))
+
+        sys.path.insert(0, str(bundle))
+        with bundles():
+            seconds, count = import_all()
+        print(f"{'bundle':>10}: {seconds:8.3f} s {count:6} opens")
+        sys.path.remove(str(bundle))
+
+
+if __name__ == "__main__":
+    main()
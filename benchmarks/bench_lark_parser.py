@@ -0,0 +1,50 @@
+"""# benchmark decoding many small notebooks with the lark parser
+
+building a `Lark_StandAlone` parser deserializes the grammar tables and lexer,
+a constant cost that used to be paid by every notebook.
+this compares building a parser for each notebook with the parser shared by each decoder type.
+
+    python benchmarks/bench_lark_parser.py
+"""
+
+from __future__ import annotations
+
+import json
+import timeit
+
+from importnb._json_parser import Lark_StandAlone
+from importnb.decoder import LineCacheNotebookDecoder
+
+#: a small notebook, like the many in a directory of examples.
+NOTEBOOK = json.dumps(
+    {
+        "cells": [
+            {"cell_type": "markdown", "metadata": {}, "source": ["# a small notebook"]},
+            {"cell_type": "code", "metadata": {}, "outputs": [], "source": ["x = 1\n", "y = x"]},
+        ],
+        "metadata": {},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    },
+    indent=1,
+)
+
+
+def rebuilt() -> None:
+    decoder = LineCacheNotebookDecoder(code=str)
+    Lark_StandAlone(transformer=decoder).parse(NOTEBOOK)
+
+
+def shared() -> None:
+    LineCacheNotebookDecoder(code=str).decode(NOTEBOOK, "<bench>")
+
+
+def main(number: int = 200) -> None:
+    shared()
+    for name, fn in (("rebuilt", rebuilt), ("shared", shared)):
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"{name:>10}: {best * 1e6:8.1f} us per notebook")
+
+
+if __name__ == "__main__":
+    main()
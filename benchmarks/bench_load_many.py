@@ -0,0 +1,66 @@
+"""# benchmark importing many notebooks at once
+
+compares importing notebooks one after another with `Notebook.load_many`,
+which decodes and compiles them in a pool of processes.
+
+    python benchmarks/bench_load_many.py
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from importnb import Notebook
+
+#: the number of notebooks, and of code cells in each notebook.
+NOTEBOOKS, CELLS = 64, 200
+
+
+def make_notebooks(directory: Path) -> list[Path]:
+    paths = []
+    for i in range(NOTEBOOKS):
+        cells = [
+            {
+                "cell_type": "code",
+                "execution_count": j,
+                "metadata": {},
+                "outputs": [],
+                "source": [f"def f{j}(x):\n", f"    return x + {j}\n"],
+            }
+            for j in range(CELLS)
+        ]
+        path = directory / f"bench_{i}.ipynb"
+        path.write_text(json.dumps({"cells": cells, "metadata": {}}, indent=1), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def forget(paths: list[Path]) -> None:
+    Notebook.cache_clear()
+    for path in paths:
+        sys.modules.pop(path.stem, None)
+
+
+def main() -> None:
+    sys.dont_write_bytecode = True
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_notebooks(Path(tmp))
+        forget(paths)
+        start = perf_counter()
+        for path in paths:
+            Notebook.load_file(path, main=False)
+        print(f"{'serial':>10}: {perf_counter() - start:8.3f} s")
+        for workers in (1, os.cpu_count() or 1):
+            forget(paths)
+            start = perf_counter()
+            Notebook.load_many(paths, workers=workers)
+            print(f"{workers:>10}: {perf_counter() - start:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""# benchmark the peak memory of decoding a large executed notebook
+
+the `json` and `scan` decoders read the whole file into a string before decoding it,
+the `mmap` decoder scans the bytes of the mapped file and only decodes cell sources.
+
+    python benchmarks/bench_memory.py
+"""
+
+from __future__ import annotations
+
+import json
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+from importnb import Notebook
+
+#: the size of the outputs of each cell.
+OUTPUT_SIZE = 1 << 20
+
+
+def make_notebook(path: Path, cells: int = 50) -> None:
+    output = {"output_type": "stream", "name": "stdout", "text": ["x" * OUTPUT_SIZE]}
+    path.write_text(
+        json.dumps({
+            "cells": [
+                {
+                    "cell_type": "code",
+                    "execution_count": i,
+                    "metadata": {},
+                    "outputs": [output],
+                    "source": [f"x{i} = {i}"],
+                }
+                for i in range(cells)
+            ],
+            "metadata": {},
+            "nbformat": 4,
+            "nbformat_minor": 5,
+        }),
+        encoding="utf-8",
+    )
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, "large.ipynb")
+        make_notebook(path)
+        print(f"{'notebook':>10}: {path.stat().st_size / (1 << 20):8.1f} MiB")
+        for decoder in ("json", "scan", "mmap"):
+            Notebook.cache_clear()
+            tracemalloc.start()
+            start = perf_counter()
+            Notebook(path=str(path), decoder=decoder).get_data(str(path))
+            elapsed = perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{decoder:>10}: {peak / (1 << 20):8.1f} MiB peak {elapsed * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""# benchmark the cost of unrelated imports after entering a loader
+
+every `Notebook()` context swaps the `FileFinder` path hook.
+this measures how long finding unrelated modules takes after entering and exiting a context,
+when the `sys.path_importer_cache` is cleared compared with when its finders are replaced.
+
+    python benchmarks/bench_path_hooks.py
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+from importlib.machinery import PathFinder
+
+from importnb import Notebook
+
+#: modules found on every round, spread across the stdlib and site-packages.
+MODULES = "json", "csv", "email", "xml", "sqlite3", "pytest", "_pytest", "pluggy"
+
+
+def find_unrelated() -> None:
+    # the path finder skips sys.modules and searches sys.path with the cached finders
+    for name in MODULES:
+        PathFinder.find_spec(name)
+
+
+def targeted() -> None:
+    with Notebook():
+        find_unrelated()
+    find_unrelated()
+
+
+def cleared() -> None:
+    with Notebook():
+        sys.path_importer_cache.clear()
+        find_unrelated()
+    sys.path_importer_cache.clear()
+    find_unrelated()
+
+
+def main(number: int = 200) -> None:
+    find_unrelated()
+    for name, fn in (("cleared", cleared), ("targeted", targeted)):
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"{name:>10}: {best * 1e6:8.1f} us per context")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,17 @@ import json
 import linecache
 import os
 import platform
+import subprocess
 import sys
 from importlib import reload
+from importlib.machinery import FileFinder, PathFinder
 from importlib.util import find_spec
 from pathlib import Path
 from shutil import copyfile, rmtree
 from types import FunctionType, ModuleType
 from typing import TYPE_CHECKING, Any
 
-from pytest import fixture, mark, raises, skip
+from pytest import deprecated_call, fixture, mark, raises, skip
 
 import importnb
 
@@ -23,7 +25,7 @@ if TYPE_CHECKING:
     from importlib.machinery import ModuleSpec
 
     from _pytest.pytester import Pytester
-    from pytest import CaptureFixture
+    from pytest import CaptureFixture, MonkeyPatch
 
     from importnb import Notebook
     from importnb.finder import FileModuleSpec
@@ -103,10 +105,28 @@ def unimport(ns: str | tuple[str, ...]) -> None:
     path_importer_cache.clear()
 
 
+def write_notebook(path: Path, *cells: str) -> Path:
+    """Write a notebook of code cells."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cells_ = [{"cell_type": "code", "metadata": {}, "source": [c]} for c in cells]
+    path.write_text(json.dumps({"cells": cells_}, indent=1))
+    return path
+
+
 def test_version() -> None:
     assert importnb.__version__
 
 
+def test_lazy_imports() -> None:
+    deferred = "IPython", "importnb._json_parser", "importlib.metadata", "doit"
+    script = f"import sys, importnb; print([m for m in {deferred!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=False
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]", result.stderr
+
+
 def test_ref(ref: ModuleType) -> None:
     assert ref.__file__
     assert ref.__file__.endswith(".ipynb")
@@ -286,6 +306,134 @@ def test_fuzzy_finder_conflict(clean: None, ref: ModuleType) -> None:
             assert loader.path == loader3.path
 
 
+def test_fuzzy_index(tmp_path: Path) -> None:
+    from importnb import Notebook
+    from importnb.finder import FuzzyFinder
+
+    finder = FuzzyFinder(str(tmp_path), (Notebook, (".ipynb",)))
+    (tmp_path / "a b.ipynb").write_text("{}")
+    (tmp_path / "notes.txt").write_text("")
+    assert as_file_spec_loader(finder.find_spec("a_b"))[1].path == str(tmp_path / "a b.ipynb")
+    assert finder.fuzzy_index() == {"a b": ["a b.ipynb"]}
+    assert finder.fuzzy_search("a_b") is finder.fuzzy_search("a_b")
+    assert finder.find_spec("__c") is None
+
+    (tmp_path / "abc.ipynb").write_text("{}")
+    finder.invalidate_caches()
+    assert finder.fuzzy_search("__c") == ["abc"]
+    assert finder.fuzzy_search("a_b") == ["a b"]
+
+
+def test_file_finder_internals(tmp_path: Path) -> None:
+    from importnb import Notebook
+    from importnb.finder import FuzzyFinder, fuzzy_file_search
+
+    (tmp_path / "a b.ipynb").write_text("{}")
+    finder = FuzzyFinder(str(tmp_path), (Notebook, (".ipynb",)))
+    finder.fuzzy_index()
+    assert isinstance(finder._path_mtime, (int, float))
+    assert "a b.ipynb" in finder._path_cache
+    assert isinstance(finder._relaxed_path_cache, set)
+    assert finder._loaders == [(".ipynb", Notebook)]
+    assert callable(finder._fill_cache)
+    assert callable(finder._get_spec)
+
+    with Notebook():
+        assert fuzzy_file_search(str(tmp_path), "a_b") == [tmp_path / "a b.ipynb"]
+
+
+def test_loader_details_registry(monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+    from importnb.finder import LOADER_DETAILS, get_loader_details
+
+    with Notebook():
+        pass
+
+    def fail(*args: Any) -> None:
+        raise AssertionError("the path hooks were inspected")
+
+    monkeypatch.setattr(inspect, "getclosurevars", fail)
+    with Notebook():
+        path_id, details = get_loader_details()
+        assert LOADER_DETAILS[sys.path_hooks[path_id]] == (*details,)
+        assert any(".ipynb" in extensions for _, extensions in details)
+
+
+def test_path_importer_cache(tmp_path: Path) -> None:
+    from importnb import Notebook
+
+    sentinel = object()
+    sys.path_importer_cache[str(tmp_path)] = sentinel  # type: ignore[assignment]
+    try:
+        find_spec("json")
+        before = dict(sys.path_importer_cache)
+        with Notebook():
+            assert sys.path_importer_cache[str(tmp_path)] is sentinel
+            for path, finder in sys.path_importer_cache.items():
+                if isinstance(before.get(path), FileFinder):
+                    assert finder is not before[path]
+                    assert finder._path_cache is before[path]._path_cache  # type: ignore[attr-defined]
+                    assert ".ipynb" in [suffix for suffix, _ in finder._loaders]  # type: ignore[union-attr]
+        assert sys.path_importer_cache[str(tmp_path)] is sentinel
+    finally:
+        sys.path_importer_cache.pop(str(tmp_path))
+
+
+def test_replace_file_finders(tmp_path: Path) -> None:
+    from importnb import Notebook
+    from importnb.finder import FILE_FINDER_CACHES, FuzzyFinder, replace_file_finders
+
+    old = sys.path_importer_cache[str(tmp_path)] = FileFinder(str(tmp_path))
+    try:
+        old.find_spec("missing")
+        assert all(key in vars(old) for key in FILE_FINDER_CACHES)
+        replace_file_finders(FuzzyFinder, (Notebook, (".ipynb",)))
+        new = sys.path_importer_cache[str(tmp_path)]
+        assert all(vars(new)[key] is vars(old)[key] for key in FILE_FINDER_CACHES)
+
+        del old._path_cache  # type: ignore[attr-defined]
+        sys.path_importer_cache[str(tmp_path)] = old
+        replace_file_finders(FuzzyFinder, (Notebook, (".ipynb",)))
+        (tmp_path / "a b.ipynb").write_text("{}")
+        new = sys.path_importer_cache[str(tmp_path)]
+        assert isinstance(new, FuzzyFinder)
+        assert new.find_spec("a_b") is not None
+    finally:
+        sys.path_importer_cache.pop(str(tmp_path))
+
+
+def test_reentrant_hooks() -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    from importnb import Notebook
+    from importnb.finder import INSTALLED_DETAILS, FuzzyFinder, get_loader_details
+
+    details = get_loader_details()[1]
+    key = (".ipy", ".ipynb"), Notebook, FuzzyFinder
+    with Notebook():
+        hooks = list(sys.path_hooks)
+        with Notebook(), Notebook(lazy=True):
+            assert sys.path_hooks == hooks
+            assert INSTALLED_DETAILS[key][0] == 3
+        assert sys.path_hooks == hooks
+        with Notebook(include_fuzzy_finder=False) as other:
+            assert not other._hook_installed
+            assert sys.path_hooks == hooks
+            assert list(INSTALLED_DETAILS) == [key]
+        assert sys.path_hooks == hooks
+
+    assert get_loader_details()[1] == details
+
+    def enter(i: int) -> bool:
+        with Notebook():
+            return find_spec("Untitled42") is not None
+
+    with ThreadPoolExecutor(8) as pool:
+        assert all(pool.map(enter, range(64)))
+    assert get_loader_details()[1] == details
+    assert not INSTALLED_DETAILS
+
+
 def test_minified_json(ref: ModuleType, minified: None) -> None:
     from importnb import Notebook
 
@@ -296,6 +444,73 @@ def test_minified_json(ref: ModuleType, minified: None) -> None:
         assert example_source
 
 
+def test_json_decoder(ref: ModuleType, minified: None) -> None:
+    from importnb.decoder import (
+        JsonNotebookDecoder,
+        LineCacheNotebookDecoder,
+        MappedNotebookDecoder,
+        ScanNotebookDecoder,
+    )
+
+    outputs = [{"output_type": "stream", "text": ['"quoted [brackets]\\', "}"]}]
+    executed = json.loads((HERE / "Untitled42.ipynb").read_text(encoding="utf-8"))
+    for cell in executed["cells"]:
+        cell["outputs"] = outputs
+
+    bodies = [file.read_text(encoding="utf-8") for file in HERE.glob("*.ipynb")]
+    for body in [*bodies, json.dumps(executed, indent=1)]:
+        expected = LineCacheNotebookDecoder().decode(body, "<notebook>")
+        assert JsonNotebookDecoder().decode(body, "<notebook>") == expected
+        assert ScanNotebookDecoder().decode(body, "<notebook>") == expected
+        encoded = body.encode("utf-8")
+        assert MappedNotebookDecoder().decode(encoded, "<notebook>") == expected
+        assert MappedNotebookDecoder().decode(b"\xef\xbb\xbf" + encoded, "<notebook>") == expected
+
+    for decoder in (JsonNotebookDecoder, ScanNotebookDecoder):
+        with raises(getattr(json, "JSONDecodeError", ValueError)):
+            decoder().decode('{"cells": [{"outputs": ["]}]}', "<notebook>")
+    with raises(getattr(json, "JSONDecodeError", ValueError)):
+        MappedNotebookDecoder().decode(b'{"cells": [{"outputs": ["]}]}', "<notebook>")
+
+
+def test_json_decoder_import(clean: None, ref: ModuleType) -> None:
+    from importnb import Notebook
+
+    with Notebook(decoder="json"):
+        import Untitled42
+
+    assert Untitled42.__doc__ == ref.__doc__
+    assert Untitled42.function_with_a_markdown_docstring.__doc__
+
+    with raises(ValueError, match="nope is not a valid decoder"):
+        Notebook(decoder="nope").get_decoder()
+
+
+def test_mmap_decoder(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
+    from importnb import Notebook
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    Notebook.cache_clear()
+    path = str(HERE / "Untitled42.ipynb")
+    expected = Notebook(path=path).get_data(path)
+    Notebook.cache_clear()
+    assert Notebook(path=path, decoder="mmap").get_data(path) == expected
+    module = Notebook.load_file(path, main=False, decoder="mmap")
+    assert module.function_with_a_markdown_docstring.__doc__
+
+    empty = tmp_path / "empty.ipynb"
+    empty.write_bytes(b"")
+    with raises(getattr(json, "JSONDecodeError", ValueError)):
+        Notebook(path=str(empty), decoder="mmap").get_data(str(empty))
+
+    monkeypatch.setenv("IMPORTNB_CACHE_DIR", str(tmp_path / "cache"))
+    Notebook.cache_clear()
+    assert Notebook(path=path, decoder="mmap").get_data(path) == expected
+    Notebook.cache_clear()
+    assert Notebook(path=path, decoder="mmap").get_data(path) == expected
+    assert len(list((tmp_path / "cache").glob("*.py"))) == 1
+
+
 def test_docstrings(clean: None, ref: ModuleType) -> None:
     from importnb import Notebook
 
@@ -330,6 +545,115 @@ def test_docstrings(clean: None, ref: ModuleType) -> None:
     assert inspect.getsource(nb).strip() == "".join(cached[2]).strip()
 
 
+def test_lazy_linecache(monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+    from importnb.decoder import SourceLines
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    Notebook.cache_clear()
+    path = str(HERE / "Untitled42.ipynb")
+    linecache.cache.pop(path, None)
+
+    def no_read(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("the notebook was read by the linecache")
+
+    monkeypatch.setattr(linecache, "updatecache", no_read)
+    module = Notebook.load_file(path, main=False)
+    lines = linecache.cache[path][2]
+    assert isinstance(lines, SourceLines)
+    assert lines._lines is None, "the lines are split when first used"
+
+    Notebook.cache_clear()
+    assert inspect.getsource(module.function_with_a_markdown_docstring)
+    assert lines.get_source is None
+    assert "".join(lines) == Notebook(path=path).get_data(path).decode("utf-8")
+    linecache.checkcache(path)
+    assert linecache.cache[path][2] is lines
+
+
+def test_bytecode_cache(clean: None, ref: ModuleType, monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+
+    assert ref.__file__
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    cached = Path(Notebook().cache_from_source(ref.__file__))
+    assert cached.name.startswith("Untitled42.ipynb.")
+    assert str(cached) != Notebook(no_magic=True).cache_from_source(ref.__file__)
+    cached.unlink(missing_ok=True)
+    Notebook.cache_clear()
+
+    try:
+        with Notebook():
+            import Untitled42
+        assert cached.exists()
+        unimport(CLOBBER)
+        Notebook.cache_clear()
+        linecache.cache.pop(ref.__file__, None)
+
+        def no_decode(self: Notebook, source: str) -> str:
+            raise AssertionError("the notebook was decoded")
+
+        monkeypatch.setattr(Notebook, "raw_to_source", no_decode)
+        with Notebook():
+            import Untitled42 as nb
+        assert nb is not Untitled42
+        assert nb.function_with_a_markdown_docstring.__doc__
+        assert ast.parse(inspect.getsource(nb.function_with_a_markdown_docstring))
+    finally:
+        cached.unlink(missing_ok=True)
+
+
+def test_source_cache(
+    clean: None, ref: ModuleType, tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    from importnb import Notebook
+    from importnb.cache import SourceCache
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    Notebook.cache_clear()
+    with Notebook(cache_dir=str(tmp_path)):
+        import Untitled42
+    entries = list(tmp_path.glob("*.py"))
+    assert len(entries) == 1
+    unimport(CLOBBER)
+    Notebook.cache_clear()
+
+    def no_decoder(self: Notebook) -> None:
+        raise AssertionError("the notebook was decoded")
+
+    monkeypatch.setattr(Notebook, "get_decoder", no_decoder)
+    monkeypatch.setenv("IMPORTNB_CACHE_DIR", str(tmp_path))
+    with Notebook():
+        import Untitled42 as nb
+    assert nb is not Untitled42
+    assert nb.__doc__ == ref.__doc__
+
+    cache = SourceCache(tmp_path, max_size=entries[0].stat().st_size)
+    os.utime(entries[0], (0, 0))
+    cache.set(cache.key("{}", "a-tag"), "")
+    assert len(list(tmp_path.glob("*.py"))) == 2
+    cache.set(cache.key("{}", "another-tag"), "# too big")
+    assert not entries[0].exists()
+    assert cache.get(cache.key("{}", "another-tag")) == "# too big"
+
+
+def test_memo(clean: None, ref: ModuleType) -> None:
+    from importnb import Notebook
+
+    Notebook.cache_clear()
+    with Notebook():
+        import Untitled42
+
+        reload(Untitled42)
+    info = Notebook.cache_info()
+    assert info["code"].misses == 1
+    assert info["code"].hits == 1
+    assert info["source"].currsize == 1
+
+    Notebook.cache_clear()
+    assert Notebook.cache_info()["code"] == (0, 0, 256, 0)
+
+
 def test_python_file_takes_precedent(clean: None, ref: ModuleType, untitled_py: None) -> None:
     from importnb import Notebook
 
@@ -397,6 +721,573 @@ def test_top_level_async() -> None:
     assert async_cells
 
 
+def test_optimize(monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    path = str(HERE / "Untitled42.ipynb")
+    assert Notebook().get_optimization_level() == sys.flags.optimize
+    for level in (0, 1, 2):
+        loader = Notebook(optimize=level)
+        assert (f".opt-{level}." in loader.cache_from_source(path)) == bool(level)
+        module = Notebook.load_file(path, main=False, optimize=level)
+        assert hasattr(module, "__test__") == (level < 2)
+        assert bool(module.function_with_a_markdown_docstring.__doc__) == (level < 2)
+
+    assert Notebook(optimize=1).get_memo_key(path) != Notebook(optimize=2).get_memo_key(path)
+
+
+def test_test_strings(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
+    import doctest
+
+    from importnb import Notebook
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    path = str(HERE / "Untitled42.ipynb")
+    eager = Notebook.load_file(path, main=False)
+    lazy = Notebook.load_file(path, main=False, test_strings="lazy")
+    off = Notebook.load_file(path, main=False, test_strings="off")
+
+    assert eager.__test__
+    assert "__test__" not in vars(lazy)
+    assert lazy.__test__ == eager.__test__
+    assert "__test__" in vars(lazy)
+    assert not hasattr(off, "__test__")
+    assert doctest.DocTestFinder().find(lazy)
+
+    # a notebook without test strings is parsed for them once
+    plain = write_notebook(tmp_path / "plain_strings.ipynb", "x = 1")
+    get_test_strings, calls = Notebook.get_test_strings, []
+
+    def counted(self: Notebook, path: str) -> dict[str, str] | None:
+        calls.append(path)
+        return get_test_strings(self, path)
+
+    monkeypatch.setattr(Notebook, "get_test_strings", counted)
+    empty = Notebook.load_file(str(plain), main=False, test_strings="lazy")
+    assert empty.__test__ == {}
+    assert empty.__test__ == {}
+    assert calls == [str(plain)]
+
+    with raises(ValueError, match="'sometimes' is not one of"):
+        Notebook.load_file(path, main=False, test_strings="sometimes")
+
+
+def test_stages(monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+    from importnb.transforms import Stage
+
+    class Staged(Stage):
+        name = "staged"
+
+        def finish(self) -> Any:
+            return ast.parse("staged = True").body
+
+    class Custom(Notebook):
+        def get_stages(self, level: int = -1) -> list[Stage]:
+            return [*super().get_stages(level), Staged()]
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    Notebook.cache_clear()
+    path = str(HERE / "Untitled42.ipynb")
+    module = Custom.load_file(path, main=False)
+    assert module.staged
+    assert module.__test__
+    assert module.function_with_a_markdown_docstring.__doc__
+    assert set(Notebook.stage_info()) == {"markdown-docstring", "test-strings", "staged"}
+    assert all(us >= 0 for us in Notebook.stage_info().values())
+
+
+def test_stage_doctests() -> None:
+    import doctest
+
+    from importnb import docstrings, transforms
+
+    for module in (transforms, docstrings):
+        assert doctest.testmod(module).failed == 0
+
+
+def test_deprecated_transformers() -> None:
+    from importnb.docstrings import TestStrings, markdown_docstring
+    from importnb.loader import DefsOnly
+
+    source = '"""doc"""\nx = 1\n"""markdown"""\ndef f():\n    pass\n'
+    with deprecated_call():
+        module = DefsOnly().visit(ast.parse(source))
+    assert [type(node).__name__ for node in module.body] == ["FunctionDef"]
+    with deprecated_call():
+        transformer = TestStrings()
+    transformer.visit(ast.parse(source))
+    assert [node.value for node in transformer.strings] == ["markdown"]
+    *nodes, node = ast.parse(source).body
+    with deprecated_call():
+        body = markdown_docstring(nodes, node)
+    assert ast.get_docstring(body[-1]) == "markdown"
+
+
+def test_compact_source(monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+    from importnb.decoder import LineTable
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    Notebook.cache_clear()
+    path = str(HERE / "Untitled42.ipynb")
+    sparse = Notebook(path=path).get_data(path).decode("utf-8")
+    compact = Notebook(path=path, compact=True).get_data(path).decode("utf-8")
+    assert "\n\n\n" not in compact
+    table = LineTable.from_source(compact)
+    assert table
+    assert table.expand(compact) == sparse.splitlines(True)
+
+    nodes = Notebook(path=path).source_to_nodes(sparse, path)
+    assert ast.dump(nodes, include_attributes=True) == ast.dump(
+        Notebook(path=path, compact=True).source_to_nodes(compact, path), include_attributes=True
+    )
+
+    module = Notebook.load_file(path, main=False, compact=True)
+    function = module.function_with_a_markdown_docstring
+    lineno = function.__code__.co_firstlineno
+    assert linecache.getline(path, lineno) == sparse.splitlines(True)[lineno - 1]
+
+    with raises(SyntaxError) as error:
+        Notebook(compact=True).source_to_nodes(f"x = 1\n(\n{table.prefix} 1:10 2:20\n", path)
+    assert error.value.lineno == 20
+
+
+def test_cell_cache(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    Notebook.cache_clear()
+    path = write_notebook(tmp_path / "cells.ipynb", "a = 1", "b = a + 1", "def f():\n    return b")
+    assert Notebook.load_file(path, main=False).f() == 2
+    assert Notebook.cache_info()["cell_nodes"].misses == 3
+
+    write_notebook(path, "a = 1", "b = a + 2", "def f():\n    return b")
+    os.utime(path, ns=(0, 0))
+    assert Notebook.load_file(path, main=False).f() == 3
+    info = Notebook.cache_info()
+    assert info["cell_nodes"].misses == 4
+    assert info["cell_nodes"].hits == 2
+    assert info["cells"].hits == 2
+
+    loader = Notebook(path=str(path))
+    loader.decode(path.read_text(), str(path))
+    assert loader._cell_spans is not None
+    assert "_cell_spans" not in repr(loader)
+    assert "_cell_spans" not in loader.get_options()
+
+
+@mark.parametrize("workers", [1, 2])
+def test_load_many(tmp_path: Path, monkeypatch: MonkeyPatch, workers: int) -> None:
+    from importnb import Notebook
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    Notebook.cache_clear()
+    top = write_notebook(tmp_path / "many_top.ipynb", "import many_middle\nx = many_middle.y + 1")
+    write_notebook(tmp_path / "many_middle.ipynb", "from many_bottom import z\ny = z + 1")
+    bottom = write_notebook(tmp_path / "many_bottom.ipynb", "z = 1")
+    write_notebook(tmp_path / "many_async.ipynb", "import asyncio\nawait asyncio.sleep(0)\nw = 1")
+    names = ["many_top", "many_middle", "many_bottom", "many_async"]
+    try:
+        modules = Notebook.load_many(
+            [str(top), "many_middle", bottom, "many_async"], workers=workers
+        )
+        assert list(modules) == names
+        assert modules["many_top"].x == 3
+        assert modules["many_async"].w == 1
+        assert sys.modules["many_middle"] is modules["many_middle"]
+        info = Notebook.load_info()
+        order = list(info)
+        assert order.index("many_bottom") < order.index("many_middle") < order.index("many_top")
+        assert all(timing.compile > 0 and timing.exec > 0 for timing in info.values())
+        # the code compiled by the workers is executed without compiling it again
+        assert Notebook.cache_info()["code"].hits == 4
+
+        with raises(ModuleNotFoundError):
+            Notebook.load_many(["many_missing"], workers=workers)
+        other = write_notebook(tmp_path / "other" / "many_top.ipynb", "x = 0")
+        with raises(ImportError, match="both imported as 'many_top'"):
+            Notebook.load_many([top, other], workers=workers)
+    finally:
+        for name in names:
+            sys.modules.pop(name, None)
+
+
+@mark.parametrize("workers", [1, 2])
+def test_load_many_options(tmp_path: Path, monkeypatch: MonkeyPatch, workers: int) -> None:
+    from importnb import Notebook
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    Notebook.cache_clear()
+    cells = [
+        {"cell_type": "code", "metadata": {}, "source": ["x = 1"]},
+        {"cell_type": "markdown", "metadata": {}, "source": ["a docstring"]},
+        {"cell_type": "code", "metadata": {}, "source": ["def f():\n    pass"]},
+    ]
+    (tmp_path / "many_options.ipynb").write_text(json.dumps({"cells": cells}))
+    try:
+        # the module is found by the loader of the outer context, and compiled with its options
+        with Notebook():
+            modules = Notebook.load_many(
+                ["many_options"], workers=workers, include_markdown_docstring=False
+            )
+        module = modules["many_options"]
+        assert module.__loader__.include_markdown_docstring
+        assert inspect.getdoc(module.f) == "a docstring"
+
+        # the in-process cache holds the code of the loader's options
+        unimport("many_options")
+        with Notebook():
+            import many_options
+        assert inspect.getdoc(many_options.f) == "a docstring"
+    finally:
+        unimport("many_options")
+
+
+def test_compile_command(
+    tmp_path: Path, monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]
+) -> None:
+    from importnb import Notebook
+    from importnb.__main__ import main
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    good = write_notebook(tmp_path / "nested" / "good.ipynb", "x = 1")
+    bad = write_notebook(tmp_path / "bad.ipynb", "x = (")
+    malformed = tmp_path / "malformed.ipynb"
+    malformed.write_text('{"cells": [')
+    write_notebook(tmp_path / ".ipynb_checkpoints" / "good-checkpoint.ipynb", "x = (")
+    (tmp_path / "data.json").write_text('{"a": 1')
+
+    assert main(["compile", "-j", "1", str(tmp_path)]) == 1
+    out, err = capsys.readouterr()
+    assert str(good) in out
+    assert f"failed {bad}: SyntaxError" in err
+    # a notebook the parser can't read is reported, and the others are still compiled
+    assert f"failed {malformed}: Unexpected" in err
+    assert "checkpoint" not in out + err
+    assert "data.json" not in out + err
+    assert "compiled 1 of 3 files" in out
+    assert main(["compile", "-q", "-j", "1", "--decoder", "json", str(malformed)]) == 1
+    assert f"failed {malformed}: JSONDecodeError" in capsys.readouterr().err
+
+    Notebook.cache_clear()
+    loader = Notebook("good", str(good))
+    assert loader.read_bytecode("good", str(good)) is not None
+    defs_only = Notebook("good", str(good), include_non_defs=False, no_magic=True)
+    assert defs_only.read_bytecode("good", str(good)) is None
+    assert main(["compile", "-q", "-j", "1", "--defs-only", "--no-magic", str(good)]) == 0
+    assert defs_only.read_bytecode("good", str(good)) is not None
+
+    def no_decode(self: Notebook, source: str) -> str:
+        raise AssertionError("the notebook was decoded")
+
+    monkeypatch.setattr(Notebook, "raw_to_source", no_decode)
+    assert Notebook.load_file(good, main=False).x == 1
+
+    assert main(["compile", "-q", "-j", "1", "--data", str(tmp_path / "data.json")]) == 1
+    assert "JSONDecodeError" in capsys.readouterr().err
+
+
+def test_tangle(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+    from importnb.__main__ import main
+    from importnb.tangle import SourceMap, TangledLoader
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    notebook = tmp_path / "tangled_nb.ipynb"
+    copyfile(HERE / "Untitled42.ipynb", notebook)
+    ref = Notebook.load_file(notebook, main=False)
+
+    assert main(["tangle", "-q", str(tmp_path)]) == 0
+    tangled = tmp_path / "tangled_nb.py"
+    source_map = SourceMap.read(str(tangled))
+    assert source_map is not None
+    assert source_map.notebook == notebook.name
+    function = ref.function_with_a_markdown_docstring
+    assert source_map(function.__code__.co_firstlineno)
+
+    try:
+        with Notebook():
+            import tangled_nb
+        assert isinstance(tangled_nb.__loader__, TangledLoader)
+        assert tangled_nb.__file__ == str(tangled)
+        # code, docstrings and test strings are those of the notebook
+        tangled_function = tangled_nb.function_with_a_markdown_docstring
+        assert tangled_function.__code__.co_filename == str(notebook)
+        assert tangled_function.__code__.co_firstlineno == function.__code__.co_firstlineno
+        assert tangled_function.__doc__ == function.__doc__
+        assert tangled_nb.class_with_a_python_docstring.__doc__
+        assert tangled_nb.__test__ == ref.__test__
+        assert inspect.getsource(tangled_function) == inspect.getsource(function)
+        unimport("tangled_nb")
+
+        # a notebook changed after it was tangled is imported in place of the python file
+        notebook.write_text(notebook.read_text().replace("MAGIC_SLUG", "CHANGED_SLUG"))
+        os.utime(tangled, ns=(0, 0))
+        with Notebook():
+            import tangled_nb
+        assert isinstance(tangled_nb.__loader__, Notebook)
+        assert tangled_nb.CHANGED_SLUG
+    finally:
+        unimport("tangled_nb")
+
+
+def test_tangle_options(tmp_path: Path, capsys: CaptureFixture[str]) -> None:
+    from importnb import Notebook
+    from importnb.__main__ import main
+    from importnb.tangle import SourceMap, get_tangle_loader
+
+    notebook = write_notebook(tmp_path / "options.ipynb", "x = 1", "def f():\n    return x")
+    assert main(["tangle", "-q", "--defs-only", str(notebook)]) == 0
+    source_map = SourceMap.read(str(tmp_path / "options.py"))
+    expected = get_tangle_loader(Notebook(include_non_defs=False)).get_cache_tag()
+    assert source_map is not None
+    assert source_map.tag == expected
+
+    # a python file that was not tangled is never replaced
+    written = write_notebook(tmp_path / "written.ipynb", "x = 1")
+    python = written.with_suffix(".py")
+    python.write_text("x = 2\n")
+    assert main(["tangle", "-q", str(written)]) == 1
+    assert "FileExistsError" in capsys.readouterr().err
+    assert python.read_text() == "x = 2\n"
+
+    # a notebook the parser can't read is reported, and the others are still tangled
+    malformed = tmp_path / "malformed.ipynb"
+    malformed.write_text('{"cells": [')
+    (tmp_path / "options.py").unlink()
+    assert main(["tangle", "-q", str(malformed), str(notebook)]) == 1
+    assert f"failed {malformed}: Unexpected" in capsys.readouterr().err
+    assert (tmp_path / "options.py").exists()
+
+
+def test_manifest(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    from importnb.__main__ import main
+    from importnb.manifest import ManifestFinder
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    package = tmp_path / "manifest_pkg"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    notebook = package / "manifest_nb.ipynb"
+    copyfile(HERE / "Untitled42.ipynb", notebook)
+    (package / "manifest_data.json").write_text('{"a": 1}')
+    # python files are imported before notebooks, so they are left out of the manifest
+    copyfile(HERE / "Untitled42.ipynb", package / "shadowed.ipynb")
+    (package / "shadowed.py").write_text("")
+
+    output = tmp_path / "importnb-manifest.json"
+    assert main(["manifest", "--data", str(tmp_path), "-o", str(output)]) == 0
+    manifest = json.loads(output.read_text())
+    modules = manifest["modules"]
+    assert sorted(modules) == ["manifest_pkg.manifest_data", "manifest_pkg.manifest_nb"]
+    assert modules["manifest_pkg.manifest_nb"]["path"] == "manifest_pkg/manifest_nb.ipynb"
+
+    # no notebook finder is installed, the manifest finds the modules
+    try:
+        with ManifestFinder.from_file(output):
+            from manifest_pkg import manifest_data, manifest_nb
+        assert manifest_nb.__file__ == str(notebook)
+        assert manifest_nb.function_with_a_markdown_docstring.__doc__
+        assert manifest_data.data == {"a": 1}
+        unimport("manifest_pkg.manifest_nb")
+
+        # a changed notebook is left to the path finders
+        notebook.write_text(notebook.read_text() + " ")
+        with ManifestFinder.from_file(output), raises(ModuleNotFoundError):
+            import manifest_pkg.manifest_nb  # noqa: F401
+    finally:
+        unimport("manifest_pkg")
+
+
+def test_manifest_path_order(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    from importlib import invalidate_caches
+
+    from importnb.manifest import ManifestFinder, build_manifest
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    write_notebook(tmp_path / "notebooks" / "manifest_top.ipynb", "x = 1")
+    manifest = build_manifest([tmp_path / "notebooks"])
+    (tmp_path / "python").mkdir()
+    (tmp_path / "python" / "manifest_top.py").write_text("x = 2\n")
+
+    monkeypatch.syspath_prepend(str(tmp_path / "notebooks"))
+    try:
+        with ManifestFinder(manifest, tmp_path) as finder:
+            assert sys.meta_path.index(finder) < sys.meta_path.index(PathFinder)
+            import manifest_top
+        assert manifest_top.x == 1
+        unimport("manifest_top")
+
+        # a python module earlier on the path is imported, as it would be without the manifest
+        monkeypatch.syspath_prepend(str(tmp_path / "python"))
+        with ManifestFinder(manifest, tmp_path):
+            import manifest_top
+        assert manifest_top.x == 2
+        unimport("manifest_top")
+
+        # the directories are listed once, new modules are found after invalidating the caches
+        (tmp_path / "python" / "manifest_top.py").unlink()
+        with ManifestFinder(manifest, tmp_path):
+            import manifest_top
+
+            assert manifest_top.x == 1
+            unimport("manifest_top")
+            (tmp_path / "python" / "manifest_top.py").write_text("x = 2\n")
+            import manifest_top
+
+            assert manifest_top.x == 1
+            unimport("manifest_top")
+            invalidate_caches()
+            import manifest_top
+
+            assert manifest_top.x == 2
+    finally:
+        unimport("manifest_top")
+
+
+def test_bundle(tmp_path: Path, monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]) -> None:
+    from importnb import Notebook
+    from importnb.__main__ import main
+    from importnb.bundle import BundledLoader, bundles
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    tree = tmp_path / "tree"
+    package = tree / "bundle_pkg"
+    (package / "namespace").mkdir(parents=True)
+    (package / "__init__.py").write_text("from . import bundle_nb\n")
+    copyfile(HERE / "Untitled42.ipynb", package / "bundle_nb.ipynb")
+    copyfile(HERE / "async-cells.ipynb", package / "namespace" / "async_nb.ipynb")
+    (package / "bundle_data.json").write_text('{"a": 1}')
+    ref = Notebook.load_file(package / "bundle_nb.ipynb", main=False)
+    ref_source = inspect.getsource(ref.function_with_a_markdown_docstring)
+
+    bundle = tmp_path / "bundle.zip"
+    assert main(["bundle", "--data", str(tree), "-o", str(bundle)]) == 0
+    # the bundle is imported without the files it was written from
+    rmtree(tree)
+    monkeypatch.syspath_prepend(str(bundle))
+    try:
+        with bundles():
+            import bundle_pkg.namespace.async_nb
+            from bundle_pkg import bundle_data, bundle_nb
+
+            opened = bundle_nb.__loader__.bundle
+        # the bundle is closed with the hook, and opened again to read the source
+        assert opened.closed
+        origin = bundle / "bundle_pkg" / "bundle_nb.ipynb"
+        assert isinstance(bundle_nb.__loader__, BundledLoader)
+        assert isinstance(bundle_nb.__loader__, Notebook)
+        assert bundle_nb.__file__ == str(origin)
+        function = bundle_nb.function_with_a_markdown_docstring
+        assert function.__code__.co_filename == str(origin)
+        assert function.__doc__ == ref.function_with_a_markdown_docstring.__doc__
+        assert inspect.getsource(function) == ref_source
+        assert bundle_nb.__test__ == ref.__test__
+        assert bundle_data.data == {"a": 1}
+        assert bundle_pkg.namespace.async_nb.__file__
+    finally:
+        unimport("bundle_pkg")
+
+    # a notebook the parser can't read fails the bundle with an error, not a traceback
+    broken = tmp_path / "broken"
+    broken.mkdir()
+    (broken / "broken_nb.ipynb").write_text('{"cells": [')
+    assert main(["bundle", str(broken), "-o", str(tmp_path / "broken.zip")]) == 1
+    assert "failed: Unexpected" in capsys.readouterr().err
+
+
+def test_zip_imports(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    import zipapp
+
+    from importnb import Notebook
+    from importnb.archive import ARCHIVES
+    from importnb.loaders import Json, Toml
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    tree = tmp_path / "tree"
+    package = tree / "zip_pkg"
+    package.mkdir(parents=True)
+    (tree / "__main__.py").write_text("")
+    (package / "__init__.py").write_text("")
+    (package / "zip_module.py").write_text("x = 1\n")
+    copyfile(HERE / "Untitled42.ipynb", package / "zip_nb.ipynb")
+    (package / "zip_json.json").write_text('{"a": 1}')
+    (package / "zip_toml.toml").write_text("a = 1\n")
+    app = tmp_path / "app.pyz"
+    zipapp.create_archive(tree, app, interpreter="/usr/bin/env python")
+    rmtree(tree)
+
+    monkeypatch.syspath_prepend(str(app))
+    try:
+        with Notebook(), Json(), Toml():
+            from zip_pkg import zip_json, zip_module, zip_nb, zip_toml
+
+            opened = ARCHIVES[str(app)]
+        # the archive is closed with the hook, and opened again to read the source
+        assert opened.closed
+        assert zip_module.x == 1
+        assert zip_nb.__file__ == str(app / "zip_pkg" / "zip_nb.ipynb")
+        assert isinstance(zip_nb.__loader__, Notebook)
+        assert zip_nb.function_with_a_markdown_docstring.__doc__
+        assert "def function_with_a_markdown_docstring" in inspect.getsource(zip_nb)
+        assert zip_json.data == zip_toml.data == {"a": 1}
+        unimport("zip_pkg.zip_nb")
+
+        # without a loader, the archive is left to zipimport
+        with raises(ModuleNotFoundError):
+            import zip_pkg.zip_nb  # noqa: F401
+    finally:
+        unimport("zip_pkg")
+
+
+def test_shared_lark_parser() -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    from importnb.decoder import LineCacheNotebookDecoder, get_parser
+
+    raw = (HERE / "Untitled42.ipynb").read_text(encoding="utf-8")
+    expected = LineCacheNotebookDecoder().decode(raw, "<shared>")
+    assert get_parser(LineCacheNotebookDecoder) is get_parser(LineCacheNotebookDecoder)
+
+    def decode(i: int) -> str:
+        return LineCacheNotebookDecoder().decode(raw, "<shared>")
+
+    with ThreadPoolExecutor(8) as pool:
+        assert set(pool.map(decode, range(32))) == {expected}
+
+
+def test_top_level_async_statements(monkeypatch: MonkeyPatch) -> None:
+    from importnb import Notebook
+
+    compiled: list[int] = []
+    nodes_to_statements = Notebook.nodes_to_statements
+
+    def count(self: Notebook, nodes: ast.Module, path: str, **kwargs: Any) -> tuple[Any, ...]:
+        statements = nodes_to_statements(self, nodes, path, **kwargs)
+        compiled.append(len(statements))
+        return statements
+
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.setattr(Notebook, "nodes_to_statements", count)
+    Notebook.cache_clear()
+    for _ in range(2):
+        unimport("async_cells")
+        with Notebook():
+            import async_cells
+
+        assert async_cells.awaited_data == 10
+
+    # the statements are compiled at most once, earlier tests may have cached them as bytecode
+    assert len(compiled) <= 1
+    assert Notebook.cache_info()["statements"].hits == 2
+
+
 @mark.parametrize(
     ("data_loader", "data_writer"), [("yaml", "ruamel"), ("toml", "tomli_w"), ("json", "json")]
 )
@@ -5,10 +5,22 @@ from __future__ import annotations
 __all__ = "Notebook", "__version__", "get_ipython", "imports", "is_ipython", "reload"
 
 import builtins
+from typing import TYPE_CHECKING, Any
 
-from ._version import __version__
 from .entry_points import imports
 from .loader import Notebook, reload
 from .utils.ipython import get_ipython, is_ipython
 
+if TYPE_CHECKING:
+    from ._version import __version__
+
+
+def __getattr__(name: str) -> Any:
+    if name == "__version__":
+        from . import _version
+
+        return _version.__version__
+    raise AttributeError(name)
+
+
 builtins.true, builtins.false, builtins.null = True, False, None  # type: ignore[attr-defined]
@@ -7,6 +7,24 @@ from . import Notebook
 
 def main(argv: list[str] | None = None) -> int:
     """A convenience function for running importnb as an application"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["compile"]:
+        from .compileall import main as compile_main
+
+        return compile_main(argv[1:])
+    if argv[:1] == ["tangle"]:
+        from .tangle import main as tangle_main
+
+        return tangle_main(argv[1:])
+    if argv[:1] == ["manifest"]:
+        from .manifest import main as manifest_main
+
+        return manifest_main(argv[1:])
+    if argv[:1] == ["bundle"]:
+        from .bundle import main as bundle_main
+
+        return bundle_main(argv[1:])
     Notebook.load_argv(argv)
     return 0
 
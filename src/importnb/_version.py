@@ -1 +1,11 @@
-__version__ = f"""{__import__("importlib.metadata").metadata.version("importnb")}"""
+from __future__ import annotations
+
+
+def __getattr__(name: str) -> str:
+    # reading the installed metadata is slow, so the version is found on first use
+    if name == "__version__":
+        from importlib.metadata import version
+
+        globals()[name] = value = version("importnb")
+        return value
+    raise AttributeError(name)
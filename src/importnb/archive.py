@@ -0,0 +1,217 @@
+"""# importing from zip archives
+
+`zipimport` imports python modules from zip archives on `sys.path`, like zipapps and zipped
+wheels, but knows nothing of notebooks. while a loader like `Notebook` or `Json` is installed,
+`ArchiveFinder` takes the place of `zipimport` for archives. python modules are still found by
+`zipimport`, and the files a loader imports are found beside them and read from the archive
+without extracting it.
+
+```python
+import sys
+from importnb import Notebook
+
+sys.path.insert(0, "app.pyz")
+with Notebook():
+    import my_notebook
+```
+
+the members of an archive are read from a memory map, and its directory is read once.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import sys
+import weakref
+import zipfile
+import zipimport
+import zlib
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .finder import INSTALLED_DETAILS, PATH_HOOK_LOCK, FileModuleSpec
+
+if TYPE_CHECKING:
+    from importlib.machinery import ModuleSpec
+
+__all__ = "Archive", "ArchiveFinder"
+
+_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+class Archive:
+    """An open zip archive, its members are read from a memory map of the file.
+
+    raises ``ImportError`` for files that are not zip archives.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        try:
+            with zipfile.ZipFile(path) as archive:
+                self.members = {info.filename: info for info in archive.infolist()}
+            with Path(path).open("rb") as file:
+                self.stat = os.fstat(file.fileno())
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, zipfile.BadZipFile) as error:
+            raise ImportError(f"{path} is not a zip archive", path=path) from error
+        # the map is closed with the archive, or when the archive is collected
+        self._finalizer = weakref.finalize(self, self.map.close)
+
+    @property
+    def closed(self) -> bool:
+        return self.map.closed
+
+    def close(self) -> None:
+        """Close the memory map of the archive."""
+        self._finalizer()
+
+    def __enter__(self) -> Archive:
+        """Use the archive within a context, closing it on exit."""
+        return self
+
+    def __exit__(self, *excepts: object) -> None:
+        """Close the archive."""
+        self.close()
+
+    def read(self, member: str) -> bytes:
+        """Read a member, like ``zipimport`` does, without opening the archive again."""
+        info = self.members[member]
+        offset = info.header_offset
+        signature, name_size, extra_size = _LOCAL_HEADER.unpack_from(self.map, offset)
+        if signature != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"bad local header for {member} in {self.path}")
+        start = offset + _LOCAL_HEADER.size + name_size + extra_size
+        data = self.map[start : start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -15)
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise zipfile.BadZipFile(f"{member} in {self.path} has an unsupported compression")
+        return data
+
+    def get_member(self, path: str) -> str | None:
+        """The member of a path within the archive, or ``None`` for other paths."""
+        if not path.startswith(self.path + os.sep):
+            return None
+        return Path(path[len(self.path) + 1 :]).as_posix()
+
+    def is_stale(self) -> bool:
+        try:
+            st = Path(self.path).stat()
+        except OSError:
+            return True
+        return (st.st_mtime_ns, st.st_size) != (self.stat.st_mtime_ns, self.stat.st_size)
+
+
+#: the open archives, keyed on their paths.
+ARCHIVES: dict[str, Archive] = {}
+
+
+def open_archive(path: str) -> Archive:
+    archive = ARCHIVES.get(path)
+    if archive is None or archive.closed or archive.is_stale():
+        if archive is not None:
+            archive.close()
+        archive = ARCHIVES[path] = Archive(path)
+    return archive
+
+
+def split_archive(path: str) -> tuple[str, str]:
+    """Split a path into an archive and the directory within it, like ``zipimport``."""
+    if not path or Path(path).is_dir():
+        raise ImportError("not an archive", path=path)
+    archive, parts = Path(path), []
+    while not archive.is_file():
+        if archive.parent == archive:
+            raise ImportError("not an archive", path=path)
+        parts.append(archive.name)
+        archive = archive.parent
+    return str(archive), "".join(f"{part}/" for part in reversed(parts))
+
+
+def find_member(path: str) -> tuple[Archive, str] | None:
+    """Find the archive and member of a file in a zip archive, or ``None`` for other paths."""
+    try:
+        location, member = split_archive(path)
+        archive = open_archive(location)
+    except ImportError:
+        return None
+    member = member.rstrip("/")
+    return (archive, member) if member in archive.members else None
+
+
+class ArchiveFinder:
+    """A path entry finder for zip archives, finding the files of the installed loaders.
+
+    python modules, and the namespace packages of directories, are found by ``zipimport``.
+    """
+
+    def __init__(self, path: str) -> None:
+        location, self.prefix = split_archive(path)
+        self.archive = open_archive(location)
+        self.path = path
+        self.zipimporter = zipimport.zipimporter(path)
+
+    def find_spec(self, fullname: str, target: Any | None = None) -> ModuleSpec | None:
+        if sys.version_info >= (3, 10):
+            spec = self.zipimporter.find_spec(fullname, target)
+        else:
+            from importlib.util import spec_from_loader
+
+            loader = self.zipimporter.find_module(fullname)
+            spec = loader and spec_from_loader(fullname, loader)
+        if spec is not None and spec.loader is not None:
+            return spec
+        tail = fullname.rpartition(".")[2]
+        with PATH_HOOK_LOCK:
+            details = [detail for _, detail in INSTALLED_DETAILS.values()]
+        for loader, extensions in details:
+            for extension in extensions:
+                for member, package in (
+                    (f"{self.prefix}{tail}/__init__{extension}", True),
+                    (f"{self.prefix}{tail}{extension}", False),
+                ):
+                    if member in self.archive.members:
+                        origin = str(Path(self.archive.path, *member.split("/")))
+                        spec = FileModuleSpec(
+                            fullname, loader(fullname, origin), origin=origin, is_package=package
+                        )
+                        if package:
+                            spec.submodule_search_locations = [str(Path(origin).parent)]
+                        return spec
+        return spec
+
+    def invalidate_caches(self) -> None:
+        if self.archive.closed or self.archive.is_stale():
+            self.archive = open_archive(self.archive.path)
+        self.zipimporter.invalidate_caches()
+
+
+def install_archive_hook() -> None:
+    """Put ``ArchiveFinder`` before ``zipimport`` on the path hooks, and on the archives."""
+    with PATH_HOOK_LOCK:
+        if ArchiveFinder in sys.path_hooks:
+            return
+        hooks = sys.path_hooks
+        index = hooks.index(zipimport.zipimporter) if zipimport.zipimporter in hooks else 0
+        hooks.insert(index, ArchiveFinder)
+        for path, finder in list(sys.path_importer_cache.items()):
+            if isinstance(finder, zipimport.zipimporter):
+                try:
+                    sys.path_importer_cache[path] = ArchiveFinder(path)
+                except ImportError:
+                    continue
+
+
+def uninstall_archive_hook() -> None:
+    """Give the archives on the path back to ``zipimport``, and close them."""
+    with PATH_HOOK_LOCK:
+        if ArchiveFinder in sys.path_hooks:
+            sys.path_hooks.remove(ArchiveFinder)
+        for path, finder in list(sys.path_importer_cache.items()):
+            if isinstance(finder, ArchiveFinder):
+                sys.path_importer_cache[path] = finder.zipimporter
+        while ARCHIVES:
+            ARCHIVES.popitem()[1].close()
@@ -0,0 +1,389 @@
+"""# bundles of compiled notebooks
+
+a tree of thousands of notebooks is thousands of files to open when a program starts.
+`importnb bundle` writes the decoded source and compiled code of every module in a tree to a
+single zip archive, and a path hook imports from the archive like `zipimport`, reading its
+members from one memory map.
+
+```bash
+importnb bundle src -o notebooks.zip
+```
+
+```python
+import sys
+from importnb.bundle import bundles
+
+sys.path.insert(0, "notebooks.zip")
+with bundles():
+    import my_package.my_notebook
+```
+
+bundles hold python files, packages and, with `--data`, data files beside the notebooks.
+notebooks keep the loader and options they were bundled with, and their source is in the
+`linecache` for tracebacks and `inspect`. code compiled for another python, or another
+optimization level, is compiled again from the bundled source.
+"""
+
+from __future__ import annotations
+
+import inspect
+import json
+import marshal
+import os
+import sys
+import tempfile
+import zipfile
+from _imp import _fix_co_filename  # type: ignore[attr-defined]
+from contextlib import contextmanager
+from functools import cache
+from importlib.machinery import ModuleSpec, SourceFileLoader
+from importlib.util import MAGIC_NUMBER
+from io import BytesIO
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+from zipimport import zipimporter
+
+from .archive import Archive, ArchiveFinder, split_archive
+from .compileall import find_files, get_file_errors, get_loader_types
+from .finder import PATH_HOOK_LOCK, FileModuleSpec
+from .loader import Loader, _get_co_flags_set
+from .loaders import DataStreamLoader
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser
+    from collections.abc import Iterable, Iterator
+    from types import CodeType
+
+__all__ = "Bundle", "BundleFinder", "build_bundle", "bundles", "main"
+
+#: the version of the bundle format.
+BUNDLE_VERSION = 1
+#: the directory of the archive holding decoded source, compiled code, and the index.
+BUNDLE_DIR = "__importnb__/"
+#: the member describing the modules of a bundle.
+BUNDLE_INDEX = BUNDLE_DIR + "index.json"
+#: the default file name of a bundle.
+BUNDLE_FILE = "importnb-bundle.zip"
+
+
+def get_level(optimize: int) -> int:
+    return sys.flags.optimize if optimize < 0 else optimize
+
+
+def find_modules(
+    roots: Iterable[str | Path], extensions: tuple[str, ...]
+) -> Iterator[tuple[str, str, str, bool]]:
+    """Find the modules of directories on ``sys.path``.
+
+    yields the path of each file, its path in the bundle, its module key, like ``pkg/module``,
+    and whether it is a package. python files are found before notebooks with the same name.
+    """
+    seen: set[str] = set()
+    for root in map(str, roots):
+        for path in find_files([root], extensions):
+            extension = Path(path).suffix
+            if extension != ".py" and (
+                Path(path).with_suffix(".py").exists() or Path(path).with_suffix("").is_dir()
+            ):
+                continue
+            file = Path(os.path.relpath(path, root)).as_posix()
+            parent, _, base = file[: -len(extension)].rpartition("/")
+            package = base == "__init__"
+            key = parent if package else file[: -len(extension)]
+            if key and key not in seen:
+                seen.add(key)
+                yield path, file, key, package
+
+
+def compile_entry(
+    path: str, name: str, loader_type: type[Loader[Any]] | None, **kwargs: Any
+) -> tuple[bytes, bytes | None]:
+    """The source of a module and its marshalled code and top-level ``await`` statements."""
+    if loader_type is None:
+        raw = Path(path).read_bytes()
+        level = get_level(kwargs.get("optimize", -1))
+        compiled = compile(raw, path, "exec", dont_inherit=True, optimize=level)
+        return raw, marshal.dumps((compiled, None))
+    loader = loader_type(name, path, **kwargs)
+    if isinstance(loader, DataStreamLoader):
+        return Path(path).read_bytes(), None
+    code = loader.get_code(name)
+    if code is None:
+        raise ImportError(f"{name!r} has no code to bundle", name=name, path=path)
+    statements = None
+    if inspect.CO_COROUTINE in _get_co_flags_set(code.co_flags):
+        statements = loader.get_statements(path)
+    return loader.get_data(path), marshal.dumps((code, statements))
+
+
+def build_bundle(
+    roots: Iterable[str | Path],
+    output: str | Path,
+    data: bool = False,
+    compression: int = zipfile.ZIP_STORED,
+    **kwargs: Any,
+) -> dict[str, Any]:
+    """Write the modules of directories on ``sys.path`` to a bundle, returning its index.
+
+    ``kwargs`` are the options of the notebook loaders.
+    """
+    loader_types: dict[str, type[Loader[Any]] | None] = {".py": None, **get_loader_types(data)}
+    modules: dict[str, dict[str, Any]] = {}
+    output = Path(output)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=output.absolute().parent)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp, "w", compression) as archive:
+            for path, file, key, package in find_modules(roots, tuple(loader_types)):
+                extension = Path(file).suffix
+                loader_type = loader_types[extension]
+                name = key.replace("/", ".")
+                source, code = compile_entry(path, name, loader_type, **kwargs)
+                # python and data files are bundled as they are, notebooks as decoded source
+                if loader_type is None or issubclass(loader_type, DataStreamLoader):
+                    source_member = file
+                else:
+                    source_member = f"{BUNDLE_DIR}{file}.py"
+                archive.writestr(source_member, source)
+                code_member = None
+                if code is not None:
+                    code_member = f"{BUNDLE_DIR}{file}.pyc"
+                    archive.writestr(code_member, code)
+                modules[key] = dict(
+                    file=file,
+                    loader=extension[1:],
+                    package=package,
+                    source=source_member,
+                    code=code_member,
+                )
+            index = dict(
+                version=BUNDLE_VERSION,
+                magic=MAGIC_NUMBER.hex(),
+                optimize=get_level(kwargs.get("optimize", -1)),
+                options=kwargs,
+                modules=modules,
+            )
+            archive.writestr(BUNDLE_INDEX, json.dumps(index, indent=1, sort_keys=True))
+        Path(tmp).replace(output)
+    except BaseException:
+        Path(tmp).unlink()
+        raise
+    return index
+
+
+class Bundle(Archive):
+    """An open bundle, and the index of its modules.
+
+    raises ``ImportError`` for files that are not bundles.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        try:
+            index = json.loads(self.read(BUNDLE_INDEX))
+        except (KeyError, ValueError, zipfile.BadZipFile) as error:
+            raise ImportError(f"{path} is not a notebook bundle", path=path) from error
+        if index.get("version") != BUNDLE_VERSION:
+            raise ImportError(f"{path} is a bundle of an unsupported version", path=path)
+        self.modules: dict[str, dict[str, Any]] = index["modules"]
+        self.options: dict[str, Any] = index["options"]
+        #: the code is only used by the python and optimization level it was compiled for.
+        self.compiled = index["magic"] == MAGIC_NUMBER.hex() and index["optimize"] == get_level(
+            self.options.get("optimize", -1)
+        )
+        #: directories without an ``__init__`` module, imported as namespace packages.
+        self.directories = {
+            key.rpartition("/")[0] for key in self.modules if "/" in key
+        } - self.modules.keys()
+
+    def get_code(
+        self, entry: dict[str, Any], origin: str
+    ) -> tuple[CodeType, tuple[CodeType, ...] | None] | None:
+        """Read the code of a module, pointing its file names at the module in the bundle."""
+        if not self.compiled or entry["code"] is None:
+            return None
+        # the code was compiled by ``build_bundle``, a bundle is trusted like a ``.pyc`` file
+        code, statements = marshal.loads(self.read(entry["code"]))  # noqa: S302
+        for co in (code, *(statements or ())):
+            _fix_co_filename(co, origin)
+        return code, statements
+
+    def get_loader(self, fullname: str, entry: dict[str, Any], origin: str) -> BundledLoader:
+        if entry["loader"] == "py":
+            loader: BundledLoader = bundled_type(SourceFileLoader)(fullname, origin)
+        else:
+            from .entry_points import loader_from_ep
+
+            loader_type = bundled_type(loader_from_ep(entry["loader"]))
+            loader = loader_type(fullname, origin, **self.options)
+        loader.bundle, loader.entry = self, entry
+        return loader
+
+
+class BundledLoader:
+    """A mixin reading the source and code of a module from a bundle, in place of its file."""
+
+    bundle: Bundle
+    entry: dict[str, Any]
+    path: str
+    _statements: tuple[CodeType, ...] | None = None
+
+    def get_bundle(self) -> Bundle:
+        """The bundle of the module, opened again if it was closed."""
+        if self.bundle.closed:
+            self.bundle = open_bundle(self.bundle.path)
+        return self.bundle
+
+    def get_data(self, path: str) -> bytes:
+        bundle = self.get_bundle()
+        if path == self.path:
+            return bundle.read(self.entry["source"])
+        member = bundle.get_member(path)
+        if member is None:
+            return super().get_data(path)  # type: ignore[misc,no-any-return]
+        try:
+            return bundle.read(member)
+        except KeyError:
+            raise FileNotFoundError(path) from None
+
+    def open_data(self, path: str) -> IO[bytes]:
+        return BytesIO(self.get_data(path))
+
+    def path_stats(self, path: str) -> dict[str, Any]:
+        raise OSError(f"{path} is in a bundle")
+
+    def get_memo_key(self, path: str) -> None:
+        # modules in a bundle are compiled once, and are never memoized on the file system
+        return None
+
+    def get_code(self, fullname: str) -> CodeType | None:
+        compiled = self.get_bundle().get_code(self.entry, self.path)
+        if compiled is not None:
+            code, self._statements = compiled
+            return code
+        if not isinstance(self, Loader):
+            return super().get_code(fullname)  # type: ignore[misc,no-any-return]
+        source = self.get_data(self.path).decode("utf-8")
+        return self.source_to_code(source, self.path, _optimize=self.get_optimization_level())
+
+    def get_statements(self, path: str) -> tuple[CodeType, ...]:
+        if self._statements is None:
+            return super().get_statements(path)  # type: ignore[misc,no-any-return]
+        return self._statements
+
+    def is_package(self, fullname: str) -> bool:
+        return bool(self.entry["package"])
+
+
+@cache
+def bundled_type(loader_type: type[Any]) -> type[Any]:
+    """A loader type reading modules from bundles."""
+    return type(f"Bundled{loader_type.__name__}", (BundledLoader, loader_type), {})
+
+
+#: the open bundles, keyed on their paths.
+BUNDLES: dict[str, Bundle] = {}
+
+
+def open_bundle(path: str) -> Bundle:
+    bundle = BUNDLES.get(path)
+    if bundle is None or bundle.closed or bundle.is_stale():
+        if bundle is not None:
+            bundle.close()
+        bundle = BUNDLES[path] = Bundle(path)
+    return bundle
+
+
+class BundleFinder:
+    """A path entry finder for a bundle, or a directory within a bundle, on ``sys.path``."""
+
+    def __init__(self, path: str) -> None:
+        archive, self.prefix = split_archive(path)
+        self.path = path
+        self.bundle = open_bundle(archive)
+
+    def find_spec(self, fullname: str, target: Any | None = None) -> ModuleSpec | None:
+        key = self.prefix + fullname.rpartition(".")[2]
+        entry = self.bundle.modules.get(key)
+        directory = str(Path(self.bundle.path, *key.split("/")))
+        if entry is None:
+            if key not in self.bundle.directories:
+                return None
+            spec = ModuleSpec(fullname, None, is_package=True)
+            spec.submodule_search_locations = [directory]
+            return spec
+        origin = str(Path(self.bundle.path, *entry["file"].split("/")))
+        loader = self.bundle.get_loader(fullname, entry, origin)
+        spec = FileModuleSpec(fullname, loader, origin=origin, is_package=entry["package"])
+        if entry["package"]:
+            spec.submodule_search_locations = [directory]
+        return spec
+
+    def invalidate_caches(self) -> None:
+        if self.bundle.closed or self.bundle.is_stale():
+            self.bundle = open_bundle(self.bundle.path)
+
+
+def install() -> None:
+    """Add the bundle path hook, in front of ``zipimport``."""
+    with PATH_HOOK_LOCK:
+        if BundleFinder not in sys.path_hooks:
+            sys.path_hooks.insert(0, BundleFinder)
+        # archives on the path may already have a ``zipimport`` finder, or none
+        for path, finder in list(sys.path_importer_cache.items()):
+            if finder is None or isinstance(finder, (zipimporter, ArchiveFinder)):
+                del sys.path_importer_cache[path]
+
+
+def uninstall() -> None:
+    """Remove the bundle path hook and its finders, and close the bundles."""
+    with PATH_HOOK_LOCK:
+        if BundleFinder in sys.path_hooks:
+            sys.path_hooks.remove(BundleFinder)
+        for path, finder in list(sys.path_importer_cache.items()):
+            if isinstance(finder, BundleFinder):
+                del sys.path_importer_cache[path]
+        # the loaders of imported modules open their bundle again to read its source
+        while BUNDLES:
+            BUNDLES.popitem()[1].close()
+
+
+@contextmanager
+def bundles() -> Iterator[None]:
+    """Import from the bundles on ``sys.path`` within a context."""
+    install()
+    try:
+        yield
+    finally:
+        uninstall()
+
+
+def get_argparser() -> ArgumentParser:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        "importnb bundle", description="write the modules of directories to one archive"
+    )
+    parser.add_argument("roots", nargs="+", help="directories on sys.path")
+    parser.add_argument("-o", "--output", default=BUNDLE_FILE, help="the bundle file")
+    parser.add_argument(
+        "-O", "--optimize", type=int, default=-1, help="the optimization level of the code"
+    )
+    parser.add_argument("--data", action="store_true", help="bundle data modules too")
+    parser.add_argument(
+        "--deflate", action="store_true", help="compress the bundle, which is slower to import"
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Write a bundle from the command line, the return code is ``1`` if it failed."""
+    ns = get_argparser().parse_args(argv)
+    compression = zipfile.ZIP_DEFLATED if ns.deflate else zipfile.ZIP_STORED
+    try:
+        index = build_bundle(ns.roots, ns.output, ns.data, compression, optimize=ns.optimize)
+    except get_file_errors() as error:
+        print(f"failed: {type(error).__name__}: {error}", file=sys.stderr)
+        return 1
+    print(f"bundled {len(index['modules'])} modules in {ns.output}")
+    return 0
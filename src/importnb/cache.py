@@ -0,0 +1,162 @@
+"""# caches of decoded notebooks
+
+decoding a notebook is the most expensive step of importing it.
+`SourceCache` is a content addressed directory of decoded source that is shared by every process
+using the same directory, like `pytest-xdist` workers or repeated command line runs.
+`LRUCache` memoizes decoded source, `ast` nodes and code objects within a process.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha256
+from pathlib import Path
+from threading import RLock
+from typing import IO, Generic, NamedTuple, TypeVar
+
+__all__ = "CacheInfo", "LRUCache", "SourceCache"
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+#: the environment variable naming a shared directory of decoded source.
+CACHE_DIR_ENV = "IMPORTNB_CACHE_DIR"
+#: the environment variable setting the size of the directory in bytes.
+CACHE_SIZE_ENV = "IMPORTNB_CACHE_SIZE"
+#: the default size of the directory in bytes.
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class SourceCache:
+    """A directory of decoded source keyed on the hash of the raw content and the loader options.
+
+    entries are written atomically, and the least recently used entries are evicted when the
+    directory grows beyond ``max_size`` bytes.
+    """
+
+    suffix = ".py"
+
+    def __init__(self, directory: str | Path, max_size: int | None = None) -> None:
+        self.directory = Path(directory)
+        if max_size is None:
+            max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        self.max_size = max_size
+
+    @classmethod
+    def from_env(cls, directory: str | None = None) -> SourceCache | None:
+        """Create a cache for a directory, or the directory in the environment if there is one."""
+        directory = directory or os.environ.get(CACHE_DIR_ENV)
+        return cls(directory) if directory else None
+
+    def key(self, raw: str | IO[bytes], tag: str) -> str:
+        """Hash the raw content of a file, from its text or the open file."""
+        digest = sha256(f"{tag}\0".encode())
+        if isinstance(raw, str):
+            digest.update(raw.encode("utf-8", "surrogatepass"))
+        else:
+            for chunk in iter(partial(raw.read, 1 << 20), b""):
+                digest.update(chunk)
+            raw.seek(0)
+        return digest.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> str | None:
+        """Read an entry and mark it as recently used."""
+        path = self.path(key)
+        try:
+            source = path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return source
+
+    def set(self, key: str, source: str) -> None:
+        """Atomically write an entry, then evict the least recently used entries."""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as file:
+                    file.write(source)
+                Path(tmp).replace(self.path(key))
+            except BaseException:
+                Path(tmp).unlink()
+                raise
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                Path(path).unlink()
+            except OSError:
+                continue
+            size -= entry_size
+
+    def clear(self) -> None:
+        for path in self.directory.glob(f"*{self.suffix}"):
+            path.unlink(missing_ok=True)
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache(Generic[K, V]):
+    """A bounded, thread safe mapping that counts its hits and misses like ``functools.lru_cache``."""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
@@ -0,0 +1,244 @@
+"""# compiling notebooks ahead of time
+
+`importnb compile` is `compileall` for notebooks. it walks directories, decodes and compiles
+every notebook in a pool of processes, and writes the bytecode cache that imports read.
+the cache is read back to validate it, so the first import of a compiled notebook is as fast as
+a warm one.
+
+```bash
+importnb compile -j 0 src notebooks
+```
+
+data modules, like `.json` and `.toml` files, have no bytecode, with `--data` they are parsed to
+find their errors.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from .loader import Loader, Notebook
+from .loaders import DataStreamLoader
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser, Namespace
+    from collections.abc import Iterable, Iterator
+
+__all__ = "Compiled", "compile_dir", "compile_file", "main"
+
+#: the options of ``Notebook`` set by ``add_loader_arguments``.
+LOADER_OPTIONS = (
+    "include_markdown_docstring",
+    "include_non_defs",
+    "no_magic",
+    "test_strings",
+    "compact",
+    "decoder",
+)
+
+
+class Compiled(NamedTuple):
+    path: str
+    #: seconds spent decoding, compiling, and writing the cache of the file.
+    seconds: float
+    #: the error compiling the file, if there was one.
+    error: str | None = None
+
+
+def get_file_errors() -> tuple[type[Exception], ...]:
+    """The errors of a file that can't be compiled, reported without stopping the other files.
+
+    notebooks the ``lark`` parser can't read raise its errors, the parser is imported when this
+    is called, so call it in an ``except`` clause.
+    """
+    from ._json_parser import LarkError
+
+    return ImportError, SyntaxError, OSError, ValueError, LarkError
+
+
+@contextmanager
+def _write_bytecode() -> Iterator[None]:
+    # like ``compileall``, the cache is written even if ``PYTHONDONTWRITEBYTECODE`` is set
+    prior, sys.dont_write_bytecode = sys.dont_write_bytecode, False
+    try:
+        yield
+    finally:
+        sys.dont_write_bytecode = prior
+
+
+def compile_file(path: str, loader_type: type[Loader[Any]] = Notebook, **kwargs: Any) -> Compiled:
+    """Compile a file and write its bytecode cache, or parse a data file."""
+    start = perf_counter()
+    name = Path(path).stem
+    loader = loader_type(name, path, **kwargs)
+    try:
+        if isinstance(loader, DataStreamLoader):
+            with open(path, "rb") as file:
+                loader.get_data_loader()(file)
+        else:
+            with _write_bytecode():
+                loader.get_bytecode(name, path)
+            if loader.read_bytecode(name, path) is None:
+                cache = loader.cache_from_source(path)
+                raise OSError(f"the bytecode cache {cache} was not written")
+    except get_file_errors() as error:
+        return Compiled(path, perf_counter() - start, f"{type(error).__name__}: {error}")
+    return Compiled(path, perf_counter() - start)
+
+
+def find_files(paths: Iterable[str | Path], extensions: tuple[str, ...]) -> Iterator[str]:
+    """Walk files and directories for files with the extensions.
+
+    hidden directories, like ``.ipynb_checkpoints``, and ``__pycache__`` are skipped.
+    """
+    for path in map(str, paths):
+        if not Path(path).is_dir():
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+            for file in sorted(files):
+                if file.endswith(extensions):
+                    yield str(Path(root, file))
+
+
+def get_loader_types(data: bool = False) -> dict[str, type[Loader[Any]]]:
+    """The loaders of each extension, with the data loaders of the entry points for ``data``."""
+    loader_types: dict[str, type[Loader[Any]]] = dict.fromkeys(Notebook().extensions, Notebook)
+    if data:
+        from .entry_points import list_aliases, loader_from_ep
+
+        for alias in list_aliases():
+            try:
+                loader_type: type[Loader[Any]] = loader_from_ep(alias)
+            except ImportError:
+                continue
+            if issubclass(loader_type, DataStreamLoader):
+                for extension in loader_type().extensions:
+                    loader_types.setdefault(extension, loader_type)
+    return loader_types
+
+
+def compile_dir(
+    paths: Iterable[str | Path],
+    workers: int = 0,
+    data: bool = False,
+    **kwargs: Any,
+) -> Iterator[Compiled]:
+    """Compile the notebooks found in files and directories, in a pool of ``workers`` processes.
+
+    with ``0`` workers, a worker is started for each core.
+    """
+    loader_types = get_loader_types(data)
+    jobs = [
+        (path, loader_types.get(Path(path).suffix, Notebook))
+        for path in find_files(paths, tuple(loader_types))
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            futures = [pool.submit(compile_file, path, t, **kwargs) for path, t in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+    else:
+        for path, loader_type in jobs:
+            yield compile_file(path, loader_type, **kwargs)
+
+
+def add_loader_arguments(parser: ArgumentParser) -> None:
+    """Add the options of ``Notebook`` that change the source and code of a notebook."""
+    from argparse import SUPPRESS
+
+    from .decoder import DECODERS
+    from .loader import TEST_STRINGS
+
+    group = parser.add_argument_group("loader options")
+    group.add_argument(
+        "--no-markdown-docstring",
+        dest="include_markdown_docstring",
+        action="store_false",
+        default=SUPPRESS,
+        help="keep markdown out of docstrings",
+    )
+    group.add_argument(
+        "--defs-only",
+        dest="include_non_defs",
+        action="store_false",
+        default=SUPPRESS,
+        help="only keep imports, and function and class definitions",
+    )
+    group.add_argument(
+        "--no-magic", action="store_true", default=SUPPRESS, help="comment out IPython magics"
+    )
+    group.add_argument(
+        "--test-strings",
+        choices=TEST_STRINGS,
+        default=SUPPRESS,
+        help="how markdown is collected as doctests",
+    )
+    group.add_argument(
+        "--compact", action="store_true", default=SUPPRESS, help="decode to compact source"
+    )
+    group.add_argument(
+        "--decoder", choices=sorted(DECODERS), default=SUPPRESS, help="the notebook decoder"
+    )
+
+
+def get_loader_options(ns: Namespace) -> dict[str, Any]:
+    """The loader options given on the command line, the others are left to their defaults."""
+    return {key: getattr(ns, key) for key in LOADER_OPTIONS if hasattr(ns, key)}
+
+
+def get_argparser() -> ArgumentParser:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        "importnb compile", description="compile notebooks to their bytecode cache"
+    )
+    parser.add_argument("paths", nargs="+", help="files and directories to compile")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=0,
+        help="the number of processes, 0 uses every core",
+    )
+    parser.add_argument(
+        "-o",
+        "--optimize",
+        type=int,
+        action="append",
+        help="an optimization level to compile, may be given more than once",
+    )
+    parser.add_argument("--data", action="store_true", help="parse data modules too")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    add_loader_arguments(parser)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Compile notebooks from the command line, the return code is ``1`` if any failed."""
+    ns = get_argparser().parse_args(argv)
+    options = get_loader_options(ns)
+    start = perf_counter()
+    count = failed = 0
+    for i, level in enumerate(ns.optimize or [-1]):
+        # data modules have no bytecode, and are only parsed once
+        data = ns.data and not i
+        for compiled in compile_dir(ns.paths, ns.workers, data, optimize=level, **options):
+            count += 1
+            if compiled.error:
+                failed += 1
+                print(f"failed {compiled.path}: {compiled.error}", file=sys.stderr)
+            elif not ns.quiet:
+                print(f"{compiled.seconds * 1000:8.1f} ms {compiled.path}")
+    if not ns.quiet or failed:
+        print(f"compiled {count - failed} of {count} files in {perf_counter() - start:.2f} s")
+    return 1 if failed else 0
@@ -1,34 +1,64 @@
 from __future__ import annotations
 
+import ast
 import json
 import linecache
+import mmap
+import os
+import re
 import textwrap
+import threading
+from bisect import bisect_right
+from collections.abc import Sequence
 from functools import partial
-from typing import TYPE_CHECKING, Any, Callable, TypeVar, Union
-
-from ._json_parser import Lark_StandAlone, Token, Tree
-from ._json_parser import Transformer as Transformer_
-
-TLarkAtom = tuple[int, str]
-TLarkValue = tuple[str, str]
-TLarkCompound = Union[TLarkAtom, Token]
-TLarkCompounds = list[TLarkCompound]
-TLarkNamedBody = tuple[str, list[TLarkAtom]]
-TLarkObject = list[TLarkNamedBody]
-TLarkItem = Union[TLarkCompound, Token, TLarkCompounds, Tree[Any], TLarkNamedBody]
-TLarkItems = list[TLarkItem]
-TLarkItemReturns = Union[
-    TLarkAtom,
-    TLarkCompound,
-    TLarkValue,
-    TLarkNamedBody,
-    TLarkObject,
-    str,
-    None,
-]
+from json.decoder import JSONDecodeError
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Callable, TypeVar, Union, cast
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from ._json_parser import Token, Tree
+    from .cache import LRUCache
+
+    TLarkAtom = tuple[int, str]
+    TLarkValue = tuple[str, str]
+    TLarkCompound = Union[TLarkAtom, Token]
+    TLarkCompounds = list[TLarkCompound]
+    TLarkNamedBody = tuple[str, list[TLarkAtom]]
+    TLarkObject = list[TLarkNamedBody]
+    TLarkItem = Union[TLarkCompound, Token, TLarkCompounds, Tree[Any], TLarkNamedBody]
+    TLarkItems = list[TLarkItem]
+    TLarkItemReturns = Union[
+        TLarkAtom,
+        TLarkCompound,
+        TLarkValue,
+        TLarkNamedBody,
+        TLarkObject,
+        str,
+        None,
+    ]
 
 I = TypeVar("I")
 
+#: the characters that open or close a value when skipping raw json.
+RAW_DELIMITERS = re.compile(r'["\[\]{}]')
+RAW_DELIMITERS_BYTES = re.compile(rb'["\[\]{}]')
+#: numbers, booleans and null, skipped without being validated.
+RAW_SCALAR = re.compile(rb"[^,:\]}\s]+")
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+WHITESPACE_BYTES = re.compile(rb"[ \t\n\r]*")
+
+# the scanners ``json.decoder`` is built on are left out of its stubs, so they are typed once here
+_json_decoder: Any = json.decoder
+scanstring: Callable[[str, int], tuple[str, int]] = _json_decoder.scanstring
+
+
+def make_scan_once() -> Callable[[str, int], tuple[Any, int]]:
+    """Make the ``json`` scanner of any value, it keeps a memo so it isn't shared."""
+    scan_once: Callable[[str, int], tuple[Any, int]] = _json_decoder.JSONDecoder().scan_once
+    return scan_once
+
 
 def quote(object: str, *, quotes: str = "'''") -> str:
     if quotes in object:
@@ -36,16 +66,31 @@ def quote(object: str, *, quotes: str = "'''") -> str:
     return quotes + object + "\n" + quotes
 
 
-class Transformer(Transformer_[Any, Any]):
+class Transformer:
+    """Callbacks for the rules of the lark json grammar.
+
+    lark finds the callbacks by name, so the generated parser is only imported when it is used.
+    """
+
     def __init__(
         self,
         markdown: Callable[..., str] | None = quote,
         code: Callable[..., str] | None = textwrap.dedent,
         raw: Callable[..., str] | None = partial(textwrap.indent, prefix="# "),
+        *,
+        compact: bool = False,
+        cells: LRUCache[tuple[str, str, str], str] | None = None,
+        cache_tag: str = "",
         **kwargs: Any,
     ) -> None:
-        super().__init__(**kwargs)
-
+        self.compact = compact
+        #: rendered cells shared between decoders with the same ``cache_tag``.
+        self.cells = cells
+        self.cache_tag = cache_tag
+        #: the notebook line and rendered source of each cell of the last notebook.
+        self.spans: list[tuple[int, str]] = []
+        #: the index in the notebook of the cell of each span.
+        self.span_cells: list[int] = []
         for key in ("markdown", "code", "raw"):
             setattr(self, f"transform_{key}", locals().get(key))
 
@@ -60,6 +105,8 @@ class Transformer(Transformer_[Any, Any]):
         key = s[0][-1]
 
         if key == "cells":
+            from ._json_parser import Tree
+
             if not isinstance(s[-1], Tree):
                 return self.render(list(map(dict, s[-1])))  # type: ignore[arg-type]
         elif key in {"source", "text"}:
@@ -82,12 +129,23 @@ class Transformer(Transformer_[Any, Any]):
         s = "".join(lines)
         if not s.endswith("\n"):
             s += "\n"
-        transformed: str = getattr(self, f"transform_{kind}")(s)
+        transform: Callable[[str], str] = getattr(self, f"transform_{kind}")
+        if self.cells is None:
+            return transform(s)
+        # transforming cells is slow, so unchanged cells are rendered once
+        key = self.cache_tag, kind, s
+        transformed = self.cells.get(key)
+        if transformed is None:
+            transformed = transform(s)
+            self.cells.set(key, transformed)
         return transformed
 
     def render(self, x: list[dict[str, Any]]) -> str:
+        self.spans, self.span_cells = [], []
+        if self.compact:
+            return self.render_compact(x)
         body: list[str] = []
-        for token in x:
+        for i, token in enumerate(x):
             t = token.get("cell_type")
             try:
                 s = token["source"]
@@ -98,28 +156,502 @@ class Transformer(Transformer_[Any, Any]):
                     s = [s]
                 l, lines = s[0][0], [x[1] for x in s]
                 body.extend([""] * (l - len(body)))
-                lines = self.render_one(f"{t}", lines)
-                body.extend(lines.splitlines())
+                lines = self.render_one(f"{t}", lines).splitlines()
+                self.spans.append((len(body) + 1, "\n".join([*lines, ""])))
+                self.span_cells.append(i)
+                body.extend(lines)
         return "\n".join([*body, ""])
 
+    def render_compact(self, x: list[dict[str, Any]]) -> str:
+        """Render cells without blank line padding, ending with a `LineTable` of their notebook lines."""
+        body: list[str] = []
+        table = LineTable()
+        sparse = 0
+        for i, token in enumerate(x):
+            t = token.get("cell_type")
+            try:
+                s = token["source"]
+            except KeyError:
+                s = token.get("text")
+            if s:
+                if not isinstance(s, list):
+                    s = [s]
+                l, lines = s[0][0], [x[1] for x in s]
+                # the line the cell starts on in the padded source
+                sparse = max(l, sparse)
+                table.add(len(body) + 1, sparse + 1)
+                lines = self.render_one(f"{t}", lines).splitlines()
+                self.spans.append((sparse + 1, "\n".join([*lines, ""])))
+                self.span_cells.append(i)
+                body.extend(lines)
+                sparse += len(lines)
+        return "\n".join([*body, table.dumps()]) if table else "\n".join([*body, ""])
+
+
+class LineTable:
+    """The notebook line of each run of lines in compact source.
+
+    compact source ends with a comment of ``dense:notebook`` line pairs,
+    each starting a run of lines that are offset from the notebook by the same amount.
+    """
+
+    prefix = "# importnb:lines"
+
+    def __init__(self) -> None:
+        self.starts: list[int] = []
+        self.offsets: list[int] = []
+
+    def __bool__(self) -> bool:
+        """Whether any line of the compact source is moved from the notebook."""
+        return any(self.offsets)
+
+    def __call__(self, lineno: int) -> int:
+        """Map a line of the compact source to the notebook."""
+        i = bisect_right(self.starts, lineno) - 1
+        return lineno + self.offsets[i] if i >= 0 else lineno
+
+    def add(self, dense: int, sparse: int) -> None:
+        if not self.offsets or self.offsets[-1] != sparse - dense:
+            self.starts.append(dense)
+            self.offsets.append(sparse - dense)
+
+    def dumps(self) -> str:
+        pairs = (f"{start}:{start + offset}" for start, offset in zip(self.starts, self.offsets))
+        return f"{self.prefix} {' '.join(pairs)}\n"
+
+    @classmethod
+    def from_source(cls, source: str) -> LineTable | None:
+        """Read the table ending compact source, if there is one."""
+        start = source.rfind(cls.prefix)
+        if start < 0 or (start and source[start - 1] != "\n") or "\n" in source[start:-1]:
+            return None
+        table = cls()
+        try:
+            for pair in source[start + len(cls.prefix) :].split():
+                dense, _, sparse = pair.partition(":")
+                table.add(int(dense), int(sparse))
+        except ValueError:
+            return None
+        return table
+
+    def remap(self, nodes: ast.AST) -> ast.AST:
+        """Move the line numbers of the nodes from the compact source to the notebook."""
+        for node in ast.walk(nodes):
+            lineno = getattr(node, "lineno", None)
+            if lineno is not None:
+                node.lineno = self(lineno)  # type: ignore[attr-defined]
+                end_lineno = getattr(node, "end_lineno", None)
+                if end_lineno is not None:
+                    node.end_lineno = self(end_lineno)  # type: ignore[attr-defined]
+        return nodes
+
+    def expand(self, source: str) -> list[str]:
+        """The lines of the compact source, padded to their notebook lines."""
+        lines = source.splitlines(True)[:-1]
+        expanded = ["\n"] * (self(len(lines)) if lines else 0)
+        for i, line in enumerate(lines, 1):
+            expanded[self(i) - 1] = line
+        return expanded
+
+
+class TransformerProxy:
+    """Forward the lark callbacks of a transformer type to the transformer a thread is decoding with.
+
+    lark binds the callbacks of a transformer when a parser is built,
+    so a parser built with a proxy is shared by every decoder of the same type.
+    """
+
+    def __init__(self, cls: type[Transformer]) -> None:
+        self.cls = cls
+        self.local = threading.local()
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        """A callback of the transformer of the current thread, for lark to find by name."""
+        if name.startswith("_") or not callable(getattr(self.cls, name, None)):
+            raise AttributeError(name)
+        local = self.local
+
+        def callback(*args: Any) -> Any:
+            return getattr(local.transformer, name)(*args)
+
+        return callback
+
+
+#: a parser for each transformer type, building one deserializes the whole grammar.
+PARSERS: dict[type[Transformer], tuple[Any, TransformerProxy]] = {}
+PARSERS_LOCK = threading.Lock()
+
+
+def get_parser(cls: type[Transformer]) -> tuple[Any, TransformerProxy]:
+    """Get the shared lark parser of a transformer type, and its proxy."""
+    try:
+        return PARSERS[cls]
+    except KeyError:
+        pass
+    with PARSERS_LOCK:
+        if cls not in PARSERS:
+            from ._json_parser import Lark_StandAlone
+
+            proxy = TransformerProxy(cls)
+            PARSERS[cls] = Lark_StandAlone(transformer=proxy), proxy  # type: ignore[no-untyped-call]
+        return PARSERS[cls]
+
 
 class LineCacheNotebookDecoder(Transformer):
     def source_from_json_grammar(self, object: Any) -> Any:
-        parsed: Any = Lark_StandAlone(transformer=self).parse(object)  # type: ignore[no-untyped-call]
+        parser, proxy = get_parser(type(self))
+        # the prior transformer is restored for decoders nested in a callback
+        prior = getattr(proxy.local, "transformer", None)
+        proxy.local.transformer = self
+        try:
+            parsed: Any = parser.parse(object)
+        finally:
+            proxy.local.transformer = prior
         return parsed
 
     def decode(self, object: Any, filename: str) -> str:
         s = self.source_from_json_grammar(object)
         if s:
             source: str = s[0]
-            linecache.updatecache(filename)
-            cached: Any = linecache.cache.get(filename)
-            if cached:
-                linecache.cache[filename] = (
-                    cached[0],
-                    cached[1],
-                    source.splitlines(True),
-                    filename,
-                )
             return source
         return ""
+
+
+class NotebookScanner:
+    """A line aware scanner for the subset of nbformat that becomes source.
+
+    the keys of the notebook and its cells are walked in python, the ``source`` strings are decoded
+    with the ``json`` module's ``scanstring``, and any other value is skipped by the ``json`` C scanner.
+    the result has the same shape as the ``Transformer`` items, strings are ``(line, value)`` tuples.
+    """
+
+    def __init__(self, text: str, raw_keys: frozenset[str] = frozenset()) -> None:
+        self.text = text
+        self.raw_keys = raw_keys
+        self.pos = 0
+        self._line = 1
+        self._line_pos = 0
+        self._scan_once = make_scan_once()
+
+    def notebook(self) -> list[list[dict[str, Any]]]:
+        """Return the cells of every ``cells`` key in the notebook."""
+        cells = []
+        if self.peek() == "{":
+            for key in self.keys():
+                if key == "cells" and self.peek() == "[":
+                    cells.append([self.cell() for _ in self.values()])
+                else:
+                    self.skip()
+        else:
+            self.skip()
+        if self.peek():
+            raise self.error("Extra data", self.pos)
+        return cells
+
+    def cell(self) -> dict[str, Any]:
+        cell: dict[str, Any] = {}
+        if self.peek() != "{":
+            self.skip()
+            return cell
+        for key in self.keys():
+            if key == "cell_type":
+                value = self.value()
+                if isinstance(value, tuple):
+                    cell[key] = value[1]
+            elif key in {"source", "text"}:
+                cell[key] = self.value()
+            elif key in self.raw_keys:
+                self.skip_raw()
+            else:
+                self.skip()
+        return cell
+
+    def value(self) -> tuple[int, str] | list[Any] | None:
+        """Scan strings and arrays of strings, anything else is skipped."""
+        c = self.peek()
+        if c == '"':
+            line = self.line()
+            self.pos += 1
+            return line, self.scan_string()
+        if c == "[":
+            return [self.value() for _ in self.values()]
+        self.skip()
+        return None
+
+    def keys(self) -> Iterator[str]:
+        """Iterate the keys of an object, the consumer must scan each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            self.expect('"')
+            key = self.scan_string()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def values(self) -> Iterator[None]:
+        """Iterate the values of an array, the consumer must scan each value."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.expect(",]") == "]":
+                return
+
+    def scan_string(self) -> str:
+        """Decode the string after the opening quote at the current position."""
+        value, self.pos = scanstring(self.text, self.pos)
+        return value
+
+    def skip(self) -> None:
+        self.peek()
+        try:
+            self.pos = self._scan_once(self.text, self.pos)[1]
+        except StopIteration as e:
+            raise self.error("Expecting value", e.value) from None
+
+    def skip_raw(self) -> None:
+        """Skip an array or object by counting brackets, its contents are not tokenized or validated."""
+        if self.peek() not in {"[", "{"}:
+            self.skip()
+            return
+        text, pos, depth = self.text, self.pos, 0
+        while True:
+            match = RAW_DELIMITERS.search(text, pos)
+            if match is None:
+                raise self.error("Unterminated value", self.pos)
+            pos = match.end()
+            c = text[pos - 1]
+            if c == '"':
+                pos = self.skip_raw_string(pos)
+            elif c in {"[", "{"}:
+                depth += 1
+            else:
+                depth -= 1
+                if not depth:
+                    self.pos = pos
+                    return
+
+    def skip_raw_string(self, pos: int) -> int:
+        """Find the end of a string with ``str.find``, stepping over escaped quotes."""
+        text = self.text
+        while True:
+            end = text.find('"', pos)
+            if end < 0:
+                raise self.error("Unterminated string", pos - 1)
+            escapes = end
+            while text[escapes - 1] == "\\":
+                escapes -= 1
+            pos = end + 1
+            if not (end - escapes) % 2:
+                return pos
+
+    def peek(self) -> str:
+        self.pos = WHITESPACE.match(self.text, self.pos).end()  # type: ignore[union-attr]
+        return self.text[self.pos : self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise self.error(f"Expecting {chars!r}", self.pos)
+        self.pos += 1
+        return c
+
+    def line(self) -> int:
+        self._line += self.text.count("\n", self._line_pos, self.pos)
+        self._line_pos = self.pos
+        return self._line
+
+    def error(self, msg: str, pos: int) -> JSONDecodeError:
+        return JSONDecodeError(msg, self.text, pos)
+
+
+class MappedNotebookScanner(NotebookScanner):
+    """A `NotebookScanner` over the bytes of a file, like an ``mmap``.
+
+    only the keys and the ``source`` strings of cells are decoded to ``str``,
+    every other value is skipped by counting brackets without being copied or validated.
+    """
+
+    #: the size of the slices copied from the file to count lines.
+    chunk = 1 << 20
+
+    def __init__(self, data: bytes | mmap.mmap, raw_keys: frozenset[str] = frozenset()) -> None:
+        super().__init__("", raw_keys)
+        #: the bytes of the notebook, scanned in place of ``text``.
+        self.data = data
+        if data[:3] == b"\xef\xbb\xbf":
+            self.pos = self._line_pos = 3
+
+    def scan_string(self) -> str:
+        start = self.pos - 1
+        self.pos = self.skip_raw_string(self.pos)
+        value: str = scanstring(self.data[start : self.pos].decode("utf-8"), 1)[0]
+        return value
+
+    def skip(self) -> None:
+        c = self.peek()
+        if c in {"[", "{"}:
+            self.skip_raw()
+        elif c == '"':
+            self.pos = self.skip_raw_string(self.pos + 1)
+        else:
+            match = RAW_SCALAR.match(self.data, self.pos)
+            if not match or match.end() == self.pos:
+                raise self.error("Expecting value", self.pos)
+            self.pos = match.end()
+
+    def skip_raw(self) -> None:
+        text, pos, depth = self.data, self.pos, 0
+        while True:
+            match = RAW_DELIMITERS_BYTES.search(text, pos)
+            if match is None:
+                raise self.error("Unterminated value", self.pos)
+            pos = match.end()
+            c = text[pos - 1]
+            if c == 0x22:  # "
+                pos = self.skip_raw_string(pos)
+            elif c in {0x5B, 0x7B}:  # [ {
+                depth += 1
+            else:
+                depth -= 1
+                if not depth:
+                    self.pos = pos
+                    return
+
+    def skip_raw_string(self, pos: int) -> int:
+        text = self.data
+        while True:
+            end = text.find(b'"', pos)
+            if end < 0:
+                raise self.error("Unterminated string", pos - 1)
+            escapes = end
+            while text[escapes - 1] == 0x5C:  # \
+                escapes -= 1
+            pos = end + 1
+            if not (end - escapes) % 2:
+                return pos
+
+    def peek(self) -> str:
+        self.pos = WHITESPACE_BYTES.match(self.data, self.pos).end()  # type: ignore[union-attr]
+        return self.data[self.pos : self.pos + 1].decode("latin-1")
+
+    def line(self) -> int:
+        # mmap has no count, so lines are counted in bounded slices
+        for start in range(self._line_pos, self.pos, self.chunk):
+            self._line += self.data[start : min(start + self.chunk, self.pos)].count(b"\n")
+        self._line_pos = self.pos
+        return self._line
+
+    def error(self, msg: str, pos: int) -> JSONDecodeError:
+        return JSONDecodeError(msg, self.data[:pos].decode("utf-8", "replace"), pos)
+
+
+class JsonNotebookDecoder(LineCacheNotebookDecoder):
+    """A notebook decoder using the ``json`` module's scanner in place of the ``lark`` grammar."""
+
+    def source_from_json_grammar(self, object: Any) -> Any:
+        return [self.render(cells) for cells in NotebookScanner(object).notebook()]
+
+
+class ScanNotebookDecoder(JsonNotebookDecoder):
+    """A notebook decoder that skips cell outputs and attachments without tokenizing them.
+
+    decoding time scales with the code in a notebook rather than the size of the file,
+    but the skipped values are not validated as ``json``.
+    """
+
+    raw_keys = frozenset({"outputs", "attachments"})
+
+    def source_from_json_grammar(self, object: Any) -> Any:
+        scanner = NotebookScanner(object, self.raw_keys)
+        return [self.render(cells) for cells in scanner.notebook()]
+
+
+class MappedNotebookDecoder(ScanNotebookDecoder):
+    """A notebook decoder reading the bytes of a file through ``mmap``.
+
+    the file is never read into memory as a whole, peak memory is near the size of the code.
+    """
+
+    #: the loader passes the decoder an open file rather than its text.
+    reads_files = True
+
+    def source_from_json_grammar(self, object: str | bytes | mmap.mmap | IO[bytes]) -> Any:
+        if isinstance(object, str):
+            return super().source_from_json_grammar(object)
+        if isinstance(object, (bytes, mmap.mmap)):
+            scanner: NotebookScanner = MappedNotebookScanner(object, self.raw_keys)
+            return [self.render(cells) for cells in scanner.notebook()]
+        if not os.fstat(object.fileno()).st_size:
+            return self.source_from_json_grammar(b"")
+        with mmap.mmap(object.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return self.source_from_json_grammar(buffer)
+
+
+#: the engines decoding notebook json to python source.
+DECODERS: dict[str, type[LineCacheNotebookDecoder]] = {
+    "json": JsonNotebookDecoder,
+    "lark": LineCacheNotebookDecoder,
+    "mmap": MappedNotebookDecoder,
+    "scan": ScanNotebookDecoder,
+}
+
+
+class SourceLines(Sequence[str]):
+    """The python lines of a notebook in the ``linecache``, split from its source when first used.
+
+    most modules never appear in a traceback, so their lines are never split or kept.
+    """
+
+    def __init__(self, get_source: Callable[[], str | None]) -> None:
+        self.get_source: Callable[[], str | None] | None = get_source
+        self._lines: list[str] | None = None
+
+    @property
+    def lines(self) -> list[str]:
+        if self._lines is None:
+            source = self.get_source() if self.get_source else None
+            source = source or ""
+            table = LineTable.from_source(source)
+            self._lines = table.expand(source) if table else source.splitlines(True)
+            # the loader isn't kept once the lines are known
+            self.get_source = None
+        return self._lines
+
+    def __getitem__(self, index: Any) -> Any:
+        """A line, or a list of lines, of the source."""
+        return self.lines[index]
+
+    def __len__(self) -> int:
+        """The number of lines, splitting the source."""
+        return len(self.lines)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the lines, splitting the source."""
+        return iter(self.lines)
+
+
+def update_linecache(filename: str, source: str | Callable[[], str | None]) -> None:
+    """Register the python source of a file in the ``linecache`` in place of its raw ``json`` lines.
+
+    ``source`` may be a function reading the source when the lines are first used.
+    the entry carries the ``stat`` of the file, so ``linecache.checkcache`` drops it when the file
+    changes, but the file is never read. files in archives have no ``stat``, and are kept.
+    """
+    get_source = source if callable(source) else partial(str, source)
+    # ``linecache`` only indexes, slices and measures the lines, which ``SourceLines`` does lazily
+    lines = cast("list[str]", SourceLines(get_source))
+    entry: tuple[int, float | None, list[str], str]
+    try:
+        st = Path(filename).stat()
+    except OSError:
+        entry = 0, None, lines, filename
+    else:
+        entry = st.st_size, st.st_mtime, lines, filename
+    linecache.cache[filename] = entry
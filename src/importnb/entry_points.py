@@ -6,13 +6,6 @@ from typing import TYPE_CHECKING, Any
 
 __all__ = ("imports",)
 
-# See compatibility note on `group`
-# https://docs.python.org/3/library/importlib.metadata.html#entry-points
-if sys.version_info >= (3, 10):
-    from importlib.metadata import entry_points
-else:
-    from importlib_metadata import entry_points
-
 from .loader import Loader  # noqa: TC001
 
 if TYPE_CHECKING:
@@ -24,6 +17,13 @@ ENTRY_POINTS: dict[str, type[Loader[ModuleType]] | str] = {}
 
 def get_importnb_entry_points() -> dict[str, type[Loader[ModuleType]] | str]:
     """Discover the known importnb entry points"""
+    # See compatibility note on `group`
+    # https://docs.python.org/3/library/importlib.metadata.html#entry-points
+    if sys.version_info >= (3, 10):
+        from importlib.metadata import entry_points
+    else:
+        from importlib_metadata import entry_points
+
     for ep in entry_points(group="importnb"):
         ENTRY_POINTS[ep.name] = ep.value
     return ENTRY_POINTS
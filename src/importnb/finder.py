@@ -5,11 +5,18 @@ Many suggestions for importing notebooks use `sys.meta_paths`, but `importnb` re
 
 from __future__ import annotations
 
+import fnmatch
 import inspect
 import sys
+from functools import partial
 from importlib.machinery import FileFinder, ModuleSpec
 from pathlib import Path
-from typing import Any
+from threading import RLock
+from typing import TYPE_CHECKING, Any, Callable
+from weakref import WeakKeyDictionary
+
+if TYPE_CHECKING:
+    from importlib.abc import PathEntryFinder
 
 
 class FileModuleSpec(ModuleSpec):
@@ -47,17 +54,83 @@ def fuzzy_query(str: str) -> str:
 
 
 def fuzzy_file_search(path: str, fullname: str) -> list[Path]:
-    results: list[Path] = []
-    details = get_loader_details()[1]
-    for ext in sum((list(obj[1]) for obj in details), []):
-        results.extend(Path(path).glob(fullname + ext))
-        if "_" in fullname:
-            results.extend(Path(path).glob(fuzzy_query(fullname) + ext))
-    return results
+    """Find the files in a directory matching a name, or its fuzzy query.
+
+    a wrapper of ``FuzzyFinder.fuzzy_search`` with the loader details of the path hook.
+    """
+    finder = FuzzyFinder(path, *get_loader_details()[1])
+    return [
+        Path(path, name)
+        for stem in finder.fuzzy_search(fullname)
+        for name in finder.fuzzy_index()[stem]
+    ]
 
 
 class FuzzyFinder(FileFinder):
-    """Adds the ability to open file names with special characters using underscores."""
+    """Adds the ability to open file names with special characters using underscores.
+
+    the stems of loadable files are indexed from the `FileFinder` directory listing,
+    and the index is rebuilt only when the directory's modified time changes.
+    """
+
+    # the private state and helpers of ``FileFinder`` reused for the index. they are unchanged
+    # since python 3.3, and ``test_file_finder_internals`` fails if a python renames them.
+    _path_mtime: float
+    _path_cache: set[str]
+    _relaxed_path_cache: set[str]
+    _loaders: list[tuple[str, Callable[..., Any]]]
+    _fill_cache: Callable[[], None]
+    _get_spec: Callable[..., ModuleSpec]
+
+    def __init__(self, path: str, *loader_details: Any) -> None:
+        super().__init__(path, *loader_details)
+        self._fuzzy_mtime: float = -1
+        self._fuzzy_stems: dict[str, list[str]] = {}
+        self._fuzzy_matches: dict[str, list[str]] = {}
+
+    def invalidate_caches(self) -> None:
+        super().invalidate_caches()
+        self._fuzzy_mtime = -1
+
+    def fuzzy_index(self) -> dict[str, list[str]]:
+        """Map the stems of the loadable files in the directory to their file names."""
+        try:
+            mtime = Path(self.path or Path.cwd()).stat().st_mtime
+        except OSError:
+            mtime = -1
+        if mtime != self._path_mtime:
+            self._fill_cache()
+            self._path_mtime = mtime
+        if self._fuzzy_mtime == -1 or self._fuzzy_mtime != self._path_mtime:
+            suffixes = {suffix for suffix, _ in self._loaders}
+            stems: dict[str, list[str]] = {}
+            for name in self._path_cache:
+                for suffix in suffixes:
+                    if name.endswith(suffix) and len(name) > len(suffix):
+                        stems.setdefault(name[: -len(suffix)], []).append(name)
+            self._fuzzy_stems, self._fuzzy_matches = stems, {}
+            self._fuzzy_mtime = self._path_mtime
+        return self._fuzzy_stems
+
+    def fuzzy_search(self, fullname: str) -> list[str]:
+        """Find the stems matching a name, or its fuzzy query, with a single lookup once indexed."""
+        stems = self.fuzzy_index()
+        matches = self._fuzzy_matches.get(fullname)
+        if matches is None:
+            matches = fnmatch.filter(stems, fuzzy_query(fullname)) if "_" in fullname else []
+            if fullname in stems and fullname not in matches:
+                matches.append(fullname)
+            self._fuzzy_matches[fullname] = matches
+        return matches
+
+    def fuzzy_mtime(self, stem: str) -> float:
+        mtime = -1.0
+        for name in self._fuzzy_stems.get(stem, ()):
+            try:
+                mtime = max(mtime, Path(self.path, name).stat().st_mtime)
+            except OSError:
+                continue
+        return mtime
 
     def find_spec(self, fullname: str, target: Any | None = None) -> ModuleSpec | None:
         """Try to finder the spec and if it cannot be found, use the underscore starring syntax
@@ -65,7 +138,7 @@ class FuzzyFinder(FileFinder):
         """
         spec: ModuleSpec | None = super().find_spec(fullname, target=target)
         if spec:
-            return spec
+            return self.find_tangled(spec, target)
         raw = fullname
         original = fullname
 
@@ -76,14 +149,11 @@ class FuzzyFinder(FileFinder):
 
         if "_" in fullname:
             # find any files using the fuzzy convention
-            files = fuzzy_file_search(self.path, fullname)
-            if files:
-                # sort and create of a path of the chosen file
-                file = sorted(files, key=lambda x: x.stat().st_mtime, reverse=True)[0]
-                name = file.stem
-                if original:
-                    name = ".".join((original, name))
-                name = (original + "." + file.stem).lstrip(".")
+            stems = self.fuzzy_search(fullname)
+            if stems:
+                # choose the most recently modified file
+                stem = max(stems, key=self.fuzzy_mtime)
+                name = (original + "." + stem).lstrip(".")
                 spec = super().find_spec(name, target=target)
                 spec = spec and FuzzySpec(
                     spec.name,
@@ -96,16 +166,153 @@ class FuzzyFinder(FileFinder):
 
         return spec
 
+    def find_tangled(self, spec: ModuleSpec, target: Any | None = None) -> ModuleSpec:
+        """Choose between a python file tangled from a notebook, and the notebook.
 
-def get_loader_details() -> tuple[int, list[Any]]:
-    for id, path_hook in enumerate(sys.path_hooks):
-        try:
-            return (
-                id,
-                [*inspect.getclosurevars(path_hook).nonlocals["loader_details"]],
-            )
-        except:
+        only python files with a notebook beside them are read to find their ``SourceMap``.
+        an up to date tangled file is imported as though its code came from the notebook.
+        """
+        origin = spec.origin
+        if not origin or not origin.endswith(".py") or spec.submodule_search_locations:
+            return spec
+        stem = Path(origin).stem
+        notebooks = {
+            stem + suffix: loader
+            for suffix, loader in self._loaders
+            if suffix != ".py" and stem + suffix in self._path_cache
+        }
+        if not notebooks:
+            return spec
+
+        from .tangle import SourceMap, TangledLoader, is_fresh
+
+        source_map = SourceMap.read(origin)
+        if source_map is None or source_map.notebook not in notebooks:
+            return spec
+        notebook = str(Path(origin).parent / source_map.notebook)
+        loader = notebooks[source_map.notebook]
+        if is_fresh(source_map, origin, notebook, loader(spec.name, notebook)):
+            tangled = partial(TangledLoader, notebook=notebook)
+            return self._get_spec(tangled, spec.name, origin, None, target)
+        return self._get_spec(loader, spec.name, notebook, None, target)
+
+
+#: the loader details of path hooks, recorded when importnb creates a hook or first inspects one.
+LOADER_DETAILS: WeakKeyDictionary[Callable[..., Any], tuple[Any, ...] | None] = WeakKeyDictionary()
+
+
+def path_hook(finder: type[FileFinder], *loader_details: Any) -> Callable[[str], PathEntryFinder]:
+    """Create a `FileFinder.path_hook` and record its loader details."""
+    hook = finder.path_hook(*loader_details)
+    LOADER_DETAILS[hook] = loader_details
+    return hook
+
+
+def get_path_hook_details(path_hook: Callable[..., Any]) -> tuple[Any, ...] | None:
+    """Get the loader details of a path hook, inspecting its closure only the first time it is seen."""
+    try:
+        return LOADER_DETAILS[path_hook]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+    try:
+        details: tuple[Any, ...] | None = (
+            *inspect.getclosurevars(path_hook).nonlocals["loader_details"],
+        )
+    except (TypeError, KeyError, ValueError):
+        details = None
+    LOADER_DETAILS[path_hook] = details
+    return details
+
+
+#: the private directory listing of a ``FileFinder``, unchanged since python 3.3.
+FILE_FINDER_CACHES = "_path_mtime", "_path_cache", "_relaxed_path_cache"
+
+
+def replace_file_finders(finder: type[FileFinder], *loader_details: Any) -> None:
+    """Replace the cached `FileFinder`s with finders using new loader details.
+
+    the new finders keep the directory listings of the old ones,
+    and any other cached finders or negative entries are left alone.
+    """
+    for path, old in list(sys.path_importer_cache.items()):
+        if type(old) not in {FileFinder, FuzzyFinder}:
             continue
+        new = finder(path, *loader_details)
+        # sharing the listing is safe as ``FileFinder._fill_cache`` replaces these sets rather
+        # than changing them. a finder without them, after a python renames them, lists its
+        # directory itself; ``test_replace_file_finders`` checks the listings are still shared.
+        caches = vars(old)
+        if all(key in caches for key in FILE_FINDER_CACHES):
+            vars(new).update((key, caches[key]) for key in FILE_FINDER_CACHES)
+        sys.path_importer_cache[path] = new
+
+
+#: serializes changes to the path hook across threads.
+PATH_HOOK_LOCK = RLock()
+#: the loader details importnb added to the path hook, keyed on their extensions, loader type
+#: and finder, with the number of contexts using them.
+INSTALLED_DETAILS: dict[tuple[tuple[str, ...], type, type[FileFinder]], list[Any]] = {}
+
+
+def install_loader(
+    finder: type[FileFinder], loader: Any, extensions: tuple[str, ...], loader_type: type
+) -> bool:
+    """Add a loader to the path hook, or count another use of an installed loader.
+
+    only the first install of a loader type and finder for a set of extensions rebuilds the path
+    hook. returns False when the extensions are already handled by another loader, or finder.
+    """
+    extensions = tuple(extensions)
+    key = extensions, loader_type, finder
+    with PATH_HOOK_LOCK:
+        installed = INSTALLED_DETAILS.get(key)
+        if installed is not None:
+            installed[0] += 1
+            return True
+        path_id, loader_id, details = get_loader_index(".py")
+        for _, e in details:
+            if all(map(e.__contains__, extensions)):
+                return False
+        detail = (loader, extensions)
+        details.insert(loader_id + 1, detail)
+        INSTALLED_DETAILS[key] = [1, detail]
+        sys.path_hooks[path_id] = path_hook(finder, *details)
+        replace_file_finders(finder, *details)
+        if len(INSTALLED_DETAILS) == 1:
+            from .archive import install_archive_hook
+
+            install_archive_hook()
+        return True
+
+
+def uninstall_loader(
+    finder: type[FileFinder], extensions: tuple[str, ...], loader_type: type
+) -> None:
+    """Release a use of an installed loader, removing it from the path hook after the last one."""
+    key = tuple(extensions), loader_type, finder
+    with PATH_HOOK_LOCK:
+        installed = INSTALLED_DETAILS[key]
+        installed[0] -= 1
+        if installed[0]:
+            return
+        del INSTALLED_DETAILS[key]
+        path_id, details = get_loader_details()
+        details = [detail for detail in details if detail is not installed[1]]
+        sys.path_hooks[path_id] = path_hook(finder, *details)
+        replace_file_finders(finder, *details)
+        if not INSTALLED_DETAILS:
+            from .archive import uninstall_archive_hook
+
+            uninstall_archive_hook()
+
+
+def get_loader_details() -> tuple[int, list[Any]]:
+    for id, hook in enumerate(sys.path_hooks):
+        details = get_path_hook_details(hook)
+        if details is not None:
+            return id, [*details]
 
     raise NotImplementedError("No details")
 
@@ -8,43 +8,65 @@ the importnb loader provides an interface for transforming these objects to vali
 from __future__ import annotations
 
 import ast
+import dis
 import inspect
+import io
+import marshal
+import os
 import re
 import shlex
 import sys
 import textwrap
+import warnings
+from collections import Counter
 from contextlib import contextmanager
-from dataclasses import asdict, dataclass, field
-from functools import partial
+from dataclasses import dataclass, field, fields
+from functools import cache, partial
+from graphlib import CycleError, TopologicalSorter
+from hashlib import sha256
 from importlib import reload
 from importlib._bootstrap import (  # type: ignore[attr-defined]
     _call_with_frames_removed,
     _init_module_attrs,
     _requires_builtin,
 )
-from importlib._bootstrap_external import decode_source
-from importlib.machinery import FileFinder, ModuleSpec, SourceFileLoader
-from importlib.util import LazyLoader, find_spec
+from importlib._bootstrap_external import (  # type: ignore[attr-defined]
+    _classify_pyc,
+    _code_to_timestamp_pyc,
+    _validate_timestamp_pyc,
+    decode_source,
+)
+from importlib.machinery import BYTECODE_SUFFIXES, FileFinder, ModuleSpec, SourceFileLoader
+from importlib.util import LazyLoader, cache_from_source, find_spec, module_from_spec, resolve_name
+from itertools import starmap
 from pathlib import Path
+from time import perf_counter
 from types import CodeType, ModuleType
-from typing import TYPE_CHECKING, Any, Callable, Generic, TypeVar
+from typing import IO, TYPE_CHECKING, Any, Callable, ClassVar, Generic, NamedTuple, TypeVar
 
-from .decoder import LineCacheNotebookDecoder, quote
-from .docstrings import update_docstring
+from . import _version
+from .cache import CacheInfo, LRUCache, SourceCache
+from .decoder import DECODERS, LineCacheNotebookDecoder, LineTable, quote, update_linecache
 from .finder import (
     FileModuleSpec,
     FuzzyFinder,
-    get_loader_details,
-    get_loader_index,
+    install_loader,
+    uninstall_loader,
+)
+from .transforms import (
+    DefsOnlyStage,
+    MarkdownDocstringStage,
+    Pipeline,
+    Stage,
+    TestStringsStage,
 )
 from .utils.ipython import get_ipython
 
 if TYPE_CHECKING:
     from argparse import ArgumentParser, Namespace
-    from collections.abc import Iterator
+    from collections.abc import Iterable, Iterator, Mapping
     from importlib.abc import Loader as Loader_
 
-A = TypeVar("A", bound=ast.AST)
 M = TypeVar("M", bound=ModuleType)
 
 
@@ -54,6 +76,21 @@ VERSION = sys.version_info.major, sys.version_info.minor
 
 MAGIC = re.compile(r"^\s*%{2}", re.MULTILINE)
 ALLOW_TOP_LEVEL_AWAIT = getattr(ast, "PyCF_ALLOW_TOP_LEVEL_AWAIT", 0x0)
+#: the ways markdown test strings are collected.
+TEST_STRINGS = ("eager", "lazy", "off")
+
+#: ``Interface`` fields that do not change the compiled code, and are left out of the cache tag.
+CACHE_EXCLUDED_FIELDS = frozenset({
+    "name",
+    "path",
+    "lazy",
+    "extensions",
+    "include_fuzzy_finder",
+    "module_type",
+    "decoder",
+    "cache_dir",
+    "optimize",
+})
 
 
 def _get_co_flags_set(co_flags: int) -> set[int]:
@@ -71,10 +108,120 @@ def _get_co_flags_set(co_flags: int) -> set[int]:
     return flags
 
 
+def _awaits(node: ast.AST) -> bool:
+    """Find ``await``, ``async for``, and ``async with`` outside of a function scope."""
+    if isinstance(node, (ast.Await, ast.AsyncFor, ast.AsyncWith)):
+        return True
+    if isinstance(node, ast.comprehension) and node.is_async:
+        return True
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        # only the decorators, defaults, and annotations are evaluated in the outer scope.
+        return any(map(_awaits, [*node.decorator_list, node.args, *filter(None, [node.returns])]))
+    if isinstance(node, ast.Lambda):
+        return _awaits(node.args)
+    return any(map(_awaits, ast.iter_child_nodes(node)))
+
+
+def _imported_modules(code: CodeType, package: str) -> set[str]:
+    """Find the absolute names of the modules imported by a code object, and the code it defines."""
+    found: set[str] = set()
+    # ``IMPORT_NAME`` follows the level and the from list of the import
+    recent: list[Any] = [None, None]
+    module = None
+    for instruction in dis.get_instructions(code):
+        if instruction.opname == "IMPORT_NAME":
+            module, level = instruction.argval, recent[0]
+            if isinstance(level, int) and level > 0:
+                try:
+                    module = resolve_name("." * level + module, package)
+                except (ImportError, ValueError):
+                    module = None
+            if module:
+                parts = module.split(".")
+                found.update(".".join(parts[:i]) for i in range(1, len(parts) + 1))
+        elif instruction.opname == "IMPORT_FROM" and module:
+            # the names imported from a package may be its modules
+            found.add(f"{module}.{instruction.argval}")
+        recent = [recent[1], instruction.argval]
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            found |= _imported_modules(const, package)
+    return found
+
+
+def _compile_module(
+    loader_type: type[Loader[Any]], params: dict[str, Any], name: str, path: str
+) -> tuple[bytes | None, float]:
+    """Decode and compile a module in a worker, the code is marshalled back to ``load_many``."""
+    start = perf_counter()
+    loader = loader_type(name, path, **params)
+    try:
+        code = loader.get_code(name)
+        statements = None
+        if code is not None and inspect.CO_COROUTINE in _get_co_flags_set(code.co_flags):
+            statements = loader.get_statements(path)
+        data: bytes | None = marshal.dumps((code, statements))
+    except (ImportError, SyntaxError, OSError):
+        # the module is compiled again when it is executed, raising the error there
+        data = None
+    return data, perf_counter() - start
+
+
+def _import_order(
+    specs: dict[str, ModuleSpec], compiled: dict[str, tuple[CodeType | None, float]]
+) -> list[str]:
+    """Order modules after the modules they import, or as given when they import each other."""
+    graph: dict[str, set[str]] = {name: set() for name in specs}
+    for name, (code, _) in compiled.items():
+        if code is not None:
+            graph[name] = _imported_modules(code, specs[name].parent or "") & specs.keys()
+            graph[name].discard(name)
+    try:
+        return list(TopologicalSorter(graph).static_order())
+    except CycleError:
+        # modules importing each other are executed in the order they were given
+        return list(specs)
+
+
+class LoadTiming(NamedTuple):
+    #: seconds spent decoding and compiling a module, in a worker.
+    compile: float
+    #: seconds spent executing a module.
+    exec: float
+
+
+#: the key of a file in the in-process caches, made by ``Loader.get_memo_key``.
+MemoKey = tuple[Any, ...]
+
+
+class Memo(NamedTuple):
+    """The in-process caches shared by every loader, typed by what they hold."""
+
+    source: LRUCache[MemoKey, str]
+    nodes: LRUCache[MemoKey, ast.Module]
+    code: LRUCache[MemoKey, CodeType]
+    statements: LRUCache[MemoKey, tuple[CodeType, ...]]
+    cells: LRUCache[tuple[str, str, str], str]
+    cell_nodes: LRUCache[tuple[str, int, tuple[str, int]], ast.Module]
+
+
 class SourceModule(ModuleType):
     def __fspath__(self) -> str | None:
         return self.__file__
 
+    def __getattr__(self, name: str) -> Any:
+        # loaders with lazy test strings collect ``__test__`` when a doctest runner asks for it.
+        if name == "__test__":
+            # ``LazyLoader`` puts the loader it wraps back on the spec before the module runs.
+            loader = getattr(self.__spec__, "loader", None)
+            get_test_strings = getattr(loader, "get_test_strings", None)
+            tests = get_test_strings(self.__file__) if get_test_strings and self.__file__ else None
+            if tests is not None:
+                # notebooks without test strings keep an empty dict, so they are parsed once
+                self.__test__ = tests
+                return tests
+        raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+
 
 @dataclass
 class Interface(Generic[M]):
@@ -98,8 +245,22 @@ class Interface(Generic[M]):
     module_type: type[M] = field(default_factory=lambda: SourceModule)  # type: ignore[assignment]
     #: execute `IPython` magic statements from the loader.
     no_magic: bool = False
-
-    _loader_hook_position: int | None = field(default=0, repr=False)
+    #: the engine decoding notebook json to source: the `lark` grammar, the faster `json` scanner, `scan` skipping outputs unparsed, or `mmap` scanning the file's bytes.
+    decoder: str = "lark"
+    #: a directory of decoded notebook source shared between processes, defaults to `$IMPORTNB_CACHE_DIR`.
+    cache_dir: str | None = None
+    #: the optimization level of compiled code, `-1` uses the level of the interpreter's `-O` flags.
+    optimize: int = -1
+    #: collect markdown as `__test__` doctests `eager`ly when a module runs, `lazy` when `__test__` is first accessed, or `off`.
+    test_strings: str = "eager"
+    #: decode notebooks to dense source, and map line numbers back to the notebook on the `ast`.
+    compact: bool = False
+
+    _hook_installed: bool = field(default=False, repr=False)
+    #: the source this loader last decoded, and the notebook line and source of each of its cells.
+    _cell_spans: tuple[str, list[tuple[int, str]]] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __new__(
         cls, name: str | None = None, path: str | None = None, **kwargs: Any
@@ -109,6 +270,10 @@ class Interface(Generic[M]):
         self.__init__(**kwargs)  # type: ignore[misc]
         return self
 
+    def get_options(self) -> dict[str, Any]:
+        """The public fields of the interface, to create a loader with the same options."""
+        return {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+
 
 class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
     """The simplest implementation of a Notebook Source File Loader.
@@ -117,12 +282,29 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
 
     extensions: tuple[str, ...] = field(default_factory=lambda: (".py",))
 
+    #: in-process caches of decoded source, ``ast`` nodes, and code objects shared by every loader.
+    _memo: ClassVar[Memo] = Memo(
+        source=LRUCache(),
+        nodes=LRUCache(),
+        code=LRUCache(),
+        statements=LRUCache(),
+        cells=LRUCache(4096),
+        cell_nodes=LRUCache(4096),
+    )
+    #: nanoseconds spent in each ``ast`` stage, reported by ``Notebook.stage_info``.
+    _stage_timings: ClassVar[Counter[str]] = Counter()
+    #: the time spent on each module of the last ``load_many``, reported by ``load_info``.
+    _load_timings: ClassVar[dict[str, LoadTiming]] = {}
+
+    if TYPE_CHECKING:
+        # ``SourceFileLoader`` writes a ``.pyc`` with the mode of its source, but isn't stubbed
+        def _cache_bytecode(self, source_path: str, bytecode_path: str, data: bytes) -> None: ...
+
     @property
     def loader(self) -> Callable[..., Loader_]:
         """Generate a new loader based on the state of an existing loader."""
         loader = LazyLoader.factory(type(self)) if self.lazy else type(self)  # type: ignore[arg-type]
-        # Strip the leading underscore from slots
-        params = asdict(self)
+        params = self.get_options()
         params.pop("name")
         params.pop("path")
         return partial(loader, **params)
@@ -132,35 +314,112 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
         """Generate a new finder based on the state of an existing loader"""
         return FuzzyFinder if self.include_fuzzy_finder else FileFinder
 
-    def raw_to_source(self, source: str) -> str:
+    def raw_to_source(self, source: str | IO[bytes]) -> str:
         """Transform a string from a raw file to python source."""
         if self.path and self.path.endswith(".ipynb"):
             # when we encounter notebooks we apply different transformers to the diff cell types
-            return LineCacheNotebookDecoder(
-                code=self.code,
-                raw=self.raw,  # type: ignore[attr-defined]
-                markdown=self.markdown,  # type: ignore[attr-defined]
-            ).decode(source, self.path)
+            cache = SourceCache.from_env(self.cache_dir)
+            if cache is None:
+                return self.decode(source, self.path)
+
+            key = cache.key(source, self.get_cache_tag())
+            decoded = cache.get(key)
+            if decoded is None:
+                decoded = self.decode(source, self.path)
+                cache.set(key, decoded)
+            return decoded
 
         # for a normal file we just apply the code transformer.
-        return self.code(source)
+        return self.code(source)  # type: ignore[arg-type]
+
+    def decode(self, raw: str | IO[bytes], path: str) -> str:
+        """Decode a notebook, and remember its cells so unchanged cells can reuse their ``ast``."""
+        decoder = self.get_decoder()
+        source = decoder.decode(raw, path)
+        self._cell_spans = source, decoder.spans
+        return source
+
+    def get_decoder(self) -> LineCacheNotebookDecoder:
+        """Create a notebook decoder with the cell transformers of this loader."""
+        try:
+            decoder = DECODERS[self.decoder]
+        except KeyError:
+            raise ValueError(f"{self.decoder} is not a valid decoder.") from None
+        return decoder(
+            code=self.code,
+            raw=self.raw,  # type: ignore[attr-defined]
+            markdown=self.markdown,  # type: ignore[attr-defined]
+            compact=self.compact,
+            cells=self._memo.cells,
+            cache_tag=self.get_cache_tag(),
+        )
 
     def source_to_nodes(
         self, source: str, path: str = "<unknown>", *, _optimize: int = -1
     ) -> ast.Module:
         """Parse source string as python AST"""
+        if self._cell_spans is not None and self._cell_spans[0] == source:
+            cached = self.cells_to_nodes(self._cell_spans[1], path, _optimize=_optimize)
+            if cached is not None:
+                return cached
         flags = ast.PyCF_ONLY_AST
-        nodes: ast.Module = _call_with_frames_removed(
-            compile,
-            source,
-            path,
-            "exec",
-            flags=flags,
-            dont_inherit=True,
-            optimize=_optimize,
-        )
+        # compact source maps its lines to the notebook after parsing
+        table = LineTable.from_source(source)
+        try:
+            nodes = _call_with_frames_removed(
+                compile,
+                source,
+                path,
+                "exec",
+                flags=flags,
+                dont_inherit=True,
+                optimize=_optimize,
+            )
+        except SyntaxError as error:
+            if table and error.lineno:
+                error.lineno = table(error.lineno)
+                if getattr(error, "end_lineno", None):
+                    error.end_lineno = table(error.end_lineno)  # type: ignore[arg-type]
+            raise
+        if not isinstance(nodes, ast.Module):
+            # importing the file fails, like a module that can't be read
+            raise ImportError(f"{path} did not parse to a module", path=path)  # noqa: TRY004
+        if table:
+            table.remap(nodes)
         return nodes
 
+    def cells_to_nodes(
+        self, spans: list[tuple[int, str]], path: str, *, _optimize: int = -1
+    ) -> ast.Module | None:
+        """Assemble a module from the ``ast`` of each cell, parsing only the cells that changed.
+
+        the nodes of a cell are cached on its source, notebook line and the loader options.
+        returns None when a cell is not valid python on its own.
+        """
+        memo = self._memo.cell_nodes
+        tag = self.get_cache_tag(), _optimize
+        body: list[ast.stmt] = []
+        for lineno, text in spans:
+            key = text, lineno, tag
+            nodes = memo.get(key)
+            if nodes is None:
+                try:
+                    nodes = _call_with_frames_removed(
+                        compile,
+                        text,
+                        path,
+                        "exec",
+                        flags=ast.PyCF_ONLY_AST,
+                        dont_inherit=True,
+                        optimize=_optimize,
+                    )
+                except SyntaxError:
+                    return None
+                ast.increment_lineno(nodes, lineno - 1)
+                memo.set(key, nodes)
+            body.extend(nodes.body)
+        return ast.Module(body=body, type_ignores=[])
+
     def nodes_to_code(
         self,
         nodes: ast.Module,
@@ -195,11 +454,263 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
         """Inject an input transformation before the raw text.
 
         this method allows notebook json to be transformed line for line into vertically sparse python code.
+        bytecode files are returned untransformed.
+        """
+        if path.endswith(tuple(BYTECODE_SUFFIXES)):
+            return super().get_data(path)
+        path = self.path or path
+        key = self.get_memo_key(path)
+        source = self._memo.source.get(key) if key else None
+        if source is None:
+            source = self.read_source(path)
+            if key:
+                self._memo.source.set(key, source)
+        return source.encode("utf-8")
+
+    def read_source(self, path: str) -> str:
+        """Read a file and transform it to python source.
+
+        decoders that read files are given the open notebook instead of its text.
+        """
+        if path.endswith(".ipynb") and getattr(DECODERS.get(self.decoder), "reads_files", False):
+            try:
+                with io.open_code(path) as file:
+                    return self.raw_to_source(file)
+            except OSError:
+                # a notebook in an archive is read as text
+                pass
+        return self.raw_to_source(decode_source(self.read_raw(path)))
+
+    def read_raw(self, path: str) -> bytes:
+        """Read the bytes of a file, or of a member of a zip archive on ``sys.path``."""
+        try:
+            return super().get_data(path)
+        except OSError:
+            from .archive import find_member
+
+            found = find_member(path)
+            if found is None:
+                raise
+            archive, member = found
+            return archive.read(member)
+
+    def get_nodes(self, path: str) -> ast.Module:
+        """Parse a source file to ``ast`` nodes, memoized like the source.
+
+        the memoized nodes are shared, and must not be modified.
         """
-        return self.raw_to_source(decode_source(super().get_data(self.path or path))).encode(
-            "utf-8"
+        key = self.get_memo_key(path)
+        nodes = self._memo.nodes.get(key) if key else None
+        if nodes is None:
+            nodes = self.source_to_nodes(
+                self.get_data(path).decode("utf-8"),
+                path,
+                _optimize=self.get_optimization_level(),
+            )
+            if key:
+                self._memo.nodes.set(key, nodes)
+        # the cells are only needed to parse the source they were decoded with
+        self._cell_spans = None
+        return nodes
+
+    def get_memo_key(self, path: str) -> MemoKey | None:
+        """The in-process cache key of a file: its path, ``mtime``, size, and the loader cache tag.
+
+        the key of a member of an archive has the ``mtime`` of the archive and the member's CRC.
+        """
+        stamp: tuple[int, int | tuple[int, int]]
+        try:
+            st = Path(path).stat()
+            stamp = st.st_mtime_ns, st.st_size
+        except OSError:
+            from .archive import find_member
+
+            found = find_member(path)
+            if found is None:
+                return None
+            archive, member = found
+            info = archive.members[member]
+            stamp = archive.stat.st_mtime_ns, (info.CRC, info.file_size)
+        return (
+            path,
+            *stamp,
+            self.get_cache_tag(),
+            self.get_optimization_level(),
         )
 
+    def get_optimization_level(self) -> int:
+        """The optimization level of the loader, or of the interpreter when it is ``-1``."""
+        return sys.flags.optimize if self.optimize < 0 else self.optimize
+
+    @classmethod
+    def cache_info(cls) -> dict[str, CacheInfo]:
+        """Report the hits and misses of the in-process caches."""
+        return {kind: memo.cache_info() for kind, memo in cls._memo._asdict().items()}
+
+    @classmethod
+    def load_info(cls) -> dict[str, LoadTiming]:
+        """Report the seconds spent compiling and running each module in the last ``load_many``."""
+        return dict(cls._load_timings)
+
+    @classmethod
+    def cache_clear(cls) -> None:
+        """Empty the in-process caches."""
+        for memo in cls._memo:
+            memo.cache_clear()
+        cls._stage_timings.clear()
+
+    def get_cache_tag(self) -> str:
+        """A short hash of the loader type and options that change the compiled code."""
+        options = {k: v for k, v in self.get_options().items() if k not in CACHE_EXCLUDED_FIELDS}
+        key = [
+            _version.__version__,
+            type(self).__module__,
+            type(self).__qualname__,
+            get_dedent_engine(),
+            *map(repr, sorted(options.items())),
+        ]
+        return sha256("\0".join(key).encode("utf-8")).hexdigest()[:16]
+
+    def cache_from_source(self, path: str) -> str:
+        """The bytecode cache path for a source file.
+
+        the cache tag is part of the name so that loaders with different options,
+        and python files with the same stem, never share a ``.pyc``.
+        optimized code is cached in ``.opt-1.pyc`` and ``.opt-2.pyc`` files like python modules.
+        """
+        level = self.get_optimization_level()
+        return cache_from_source(f"{path}.{self.get_cache_tag()}.py", optimization=level or "")
+
+    def get_code(self, fullname: str) -> CodeType | None:
+        """Get the code of a module from the in-process cache, the bytecode cache, or the compiler."""
+        source_path = self.get_filename(fullname)
+        key = self.get_memo_key(source_path)
+        code = self._memo.code.get(key) if key else None
+        if code is None:
+            code, statements = self.get_bytecode(fullname, source_path)
+            if key:
+                self._memo.code.set(key, code)
+                if statements is not None:
+                    self._memo.statements.set(key, statements)
+        return code
+
+    def get_bytecode(
+        self, fullname: str, source_path: str
+    ) -> tuple[CodeType, tuple[CodeType, ...] | None]:
+        """Compile the module, or read it from a bytecode cache.
+
+        ``SourceFileLoader.get_code`` can't validate the cache of a transformed source,
+        so the ``.pyc`` is keyed on the ``mtime`` and size of the raw file, and the loader options.
+        the transformed source is stored with the code so ``get_source`` doesn't decode again,
+        and modules with top-level ``await`` store the code of each statement too.
+        """
+        st: Mapping[str, Any] | None
+        try:
+            st = self.path_stats(source_path)
+        except OSError:
+            st = None
+        cached = self.read_bytecode(fullname, source_path, st)
+        if cached is not None:
+            code, source, statements = cached
+            key = self.get_memo_key(source_path)
+            if key:
+                self._memo.source.set(key, source)
+            return code, statements
+
+        source = self.get_data(source_path).decode("utf-8")
+        nodes = self.get_nodes(source_path)
+        level = self.get_optimization_level()
+        code = self.nodes_to_code(nodes, source_path, _optimize=level)
+        statements = None
+        if inspect.CO_COROUTINE in _get_co_flags_set(code.co_flags):
+            statements = self.nodes_to_statements(nodes, source_path, _optimize=level)
+        if not sys.dont_write_bytecode and st is not None:
+            try:
+                bytecode_path = self.cache_from_source(source_path)
+                data = _code_to_timestamp_pyc(
+                    (code, source, statements), int(st["mtime"]), st["size"]
+                )
+                self._cache_bytecode(source_path, bytecode_path, data)
+            except NotImplementedError:
+                pass
+        return code, statements
+
+    def read_bytecode(
+        self, fullname: str, source_path: str, st: Mapping[str, Any] | None = None
+    ) -> tuple[CodeType, str, tuple[CodeType, ...] | None] | None:
+        """Read the code, source and statements of a module from an up to date ``.pyc``."""
+        try:
+            if st is None:
+                st = self.path_stats(source_path)
+            bytecode_path = self.cache_from_source(source_path)
+            data = self.get_data(bytecode_path)
+        except (NotImplementedError, OSError):
+            return None
+        if not self.validate_bytecode(data, fullname, bytecode_path, st):
+            return None
+        try:
+            # the cache is written by this loader, like the ``.pyc`` files python itself trusts
+            return marshal.loads(memoryview(data)[16:])  # type: ignore[no-any-return]  # noqa: S302
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def validate_bytecode(
+        self, data: bytes, fullname: str, bytecode_path: str, st: Mapping[str, Any]
+    ) -> bool:
+        """Check the header of a ``.pyc`` against the python version and the raw file's ``stat``."""
+        exc_details = {"name": fullname, "path": bytecode_path}
+        try:
+            _classify_pyc(data, fullname, exc_details)
+            _validate_timestamp_pyc(data, int(st["mtime"]), st["size"], fullname, exc_details)
+        except (ImportError, EOFError):
+            return False
+        return True
+
+    def get_statements(self, path: str) -> tuple[CodeType, ...]:
+        """Get the code of each top-level statement of a module, memoized like the module code."""
+        key = self.get_memo_key(path)
+        statements = self._memo.statements.get(key) if key else None
+        if statements is None:
+            statements = self.nodes_to_statements(
+                self.get_nodes(path), path, _optimize=self.get_optimization_level()
+            )
+            if key:
+                self._memo.statements.set(key, statements)
+        return statements
+
+    def nodes_to_statements(
+        self, nodes: ast.Module, path: str, *, _optimize: int = -1
+    ) -> tuple[CodeType, ...]:
+        """Compile each top-level statement of a module with top-level ``await``.
+
+        statements that ``await`` are compiled in ``single`` mode so ``eval`` returns a coroutine,
+        the others in ``exec`` mode. each statement is compiled once.
+        """
+        statements = []
+        for node in nodes.body:
+            if _awaits(node):
+                co = _call_with_frames_removed(
+                    compile,
+                    ast.Interactive([node]),
+                    path,
+                    "single",
+                    flags=ALLOW_TOP_LEVEL_AWAIT,
+                    dont_inherit=True,
+                    optimize=_optimize,
+                )
+            else:
+                co = _call_with_frames_removed(
+                    compile,
+                    ast.Module([node], []),
+                    path,
+                    "exec",
+                    flags=ALLOW_TOP_LEVEL_AWAIT,
+                    dont_inherit=True,
+                    optimize=_optimize,
+                )
+            statements.append(co)
+        return tuple(statements)
+
     def create_module(self, spec: ModuleSpec) -> M:
         """An overloaded ``create_module`` method injecting fuzzy finder setup logic."""
         module = self.module_type(str(spec.name))
@@ -236,6 +747,7 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
                 raise ImportError(
                     f"cannot load module {module.__name__!r} when get_code() returns None",
                 )
+            self.update_linecache(module.__spec__.name)
 
             if inspect.CO_COROUTINE not in _get_co_flags_set(code.co_flags):
                 # if there isn't any async non sense then we proceed with convention.
@@ -250,6 +762,15 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
 
             raise e
 
+    def update_linecache(self, fullname: str) -> None:
+        """Register the python source of a notebook in the ``linecache``.
+
+        the source is read through ``get_source`` when a traceback or ``inspect`` first asks for it.
+        """
+        path = self.get_filename(fullname)
+        if path.endswith(".ipynb"):
+            update_linecache(path, partial(self.get_source, fullname))
+
     def aexec_module_sync(self, module: ModuleType) -> None:
         if "anyio" in sys.modules:
             __import__("anyio").run(self.aexec_module, module)
@@ -258,31 +779,13 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
 
     async def aexec_module(self, module: ModuleType) -> None:
         """An async ``exec_module`` method permitting top-level ``await``."""
-        # there is so redundancy in this approach, but it starts getting more async.
         if TYPE_CHECKING:
             assert self.path
 
-        nodes = self.source_to_nodes(self.get_data(self.path).decode("utf-8"))
-
-        # iterate through the nodes and compile individual statements
-        for node in nodes.body:
-            co = _call_with_frames_removed(
-                compile,
-                ast.Module([node], []),
-                module.__file__,
-                "exec",
-                flags=ALLOW_TOP_LEVEL_AWAIT,
-            )
+        # the statements are compiled once, and cached with the module code.
+        for co in self.get_statements(self.path):
             if inspect.CO_COROUTINE in _get_co_flags_set(co.co_flags):
-                # when something async is encountered we compile it with the single flag
-                # this lets us use ``eval`` to retrieve our coroutine.
-                co = _call_with_frames_removed(
-                    compile,
-                    ast.Interactive([node]),
-                    module.__file__,
-                    "single",
-                    flags=ALLOW_TOP_LEVEL_AWAIT,
-                )
+                # ``eval`` of a statement compiled in ``single`` mode retrieves our coroutine.
                 await _call_with_frames_removed(
                     eval,  # noqa: S307
                     co,
@@ -303,23 +806,12 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
         return super().is_package(fullname)
 
     def __enter__(self) -> Loader[M]:
-        path_id, loader_id, details = get_loader_index(".py")
-        for _, e in details:
-            if all(map(e.__contains__, self.extensions)):
-                self._loader_hook_position = None
-                return self
-        self._loader_hook_position = loader_id + 1
-        details.insert(self._loader_hook_position, (self.loader, self.extensions))
-        sys.path_hooks[path_id] = self.finder.path_hook(*details)
-        sys.path_importer_cache.clear()
+        self._hook_installed = install_loader(self.finder, self.loader, self.extensions, type(self))
         return self
 
     def __exit__(self, *excepts: object) -> None:
-        if self._loader_hook_position is not None:
-            path_id, details = get_loader_details()
-            details.pop(self._loader_hook_position)
-            sys.path_hooks[path_id] = self.finder.path_hook(*details)
-            sys.path_importer_cache.clear()
+        if self._hook_installed:
+            uninstall_loader(self.finder, self.extensions, type(self))
 
     @classmethod
     def load_file(
@@ -365,6 +857,125 @@ class Loader(Interface[M], SourceFileLoader, Generic[M]):  # type: ignore[misc]
             spec.loader.exec_module(module)
             return module  # type: ignore[return-value]
 
+    @classmethod
+    def load_many(
+        cls,
+        modules: Iterable[str | Path],
+        workers: int | None = None,
+        **kwargs: Any,
+    ) -> dict[str, M]:
+        """Import many notebooks, decoding and compiling them in a pool of processes.
+
+        ``modules``: module names, or files imported as the module named by their stem.
+        ``workers``: the number of processes, with one worker modules are compiled in this process.
+
+        the code of each module is marshalled back from the workers, and the modules are executed
+        here, after the modules they import. ``load_info`` reports the time spent on each module.
+
+        >>> modules = Notebook.load_many(["foo", "bar.ipynb"], workers=4)
+        """
+        with cls(**kwargs) as self:
+            specs = self.find_specs(modules)
+            compiled = self.compile_specs(specs, workers)
+            return self.exec_specs(specs, _import_order(specs, compiled), compiled)
+
+    def find_specs(self, modules: Iterable[str | Path]) -> dict[str, ModuleSpec]:
+        """Find the specs of modules, or of files imported as the module named by their stem.
+
+        raises ``ImportError`` when different files would be imported as the same module.
+        """
+        params = self.get_options()
+        params.pop("name")
+        params.pop("path")
+        specs: dict[str, ModuleSpec] = {}
+        for module in modules:
+            spec: ModuleSpec | None
+            if isinstance(module, Path) or module.endswith(self.extensions):
+                name = Path(module).stem
+                spec = FileModuleSpec(
+                    name, type(self)(name, str(module), **params), origin=str(module)
+                )
+            else:
+                spec = find_spec(module)
+                if spec is None:
+                    raise ModuleNotFoundError(f"No module named {module!r}", name=module)
+            other = specs.setdefault(spec.name, spec)
+            if other is not spec and (
+                Path(other.origin or "").resolve() != Path(spec.origin or "").resolve()
+            ):
+                raise ImportError(
+                    f"{other.origin} and {spec.origin} are both imported as {spec.name!r}",
+                    name=spec.name,
+                )
+        return specs
+
+    def compile_specs(
+        self, specs: dict[str, ModuleSpec], workers: int | None = None
+    ) -> dict[str, tuple[CodeType | None, float]]:
+        """Decode and compile the modules not yet imported in a pool of processes.
+
+        the code is kept in the in-process cache, and returned with the seconds spent on each module.
+        each module is compiled with the options of its own loader, which executes the code.
+        """
+        jobs: list[tuple[type[Loader[Any]], dict[str, Any], str, str]] = []
+        loaders: list[Loader[Any]] = []
+        for name, spec in specs.items():
+            if name not in sys.modules and isinstance(spec.loader, Loader) and spec.origin:
+                params = spec.loader.get_options()
+                params.pop("name")
+                params.pop("path")
+                jobs.append((type(spec.loader), params, name, spec.origin))
+                loaders.append(spec.loader)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1 and len(jobs) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+                futures = [pool.submit(_compile_module, *job) for job in jobs]
+                results = [future.result() for future in futures]
+        else:
+            results = list(starmap(_compile_module, jobs))
+
+        compiled: dict[str, tuple[CodeType | None, float]] = {}
+        for loader, (_, _, name, path), (data, seconds) in zip(loaders, jobs, results):
+            code = None
+            if data is not None:
+                # the code was marshalled by ``_compile_module``, in a worker of this process
+                code, statements = marshal.loads(data)  # noqa: S302
+                key = loader.get_memo_key(path)
+                if key:
+                    self._memo.code.set(key, code)
+                    if statements is not None:
+                        self._memo.statements.set(key, statements)
+            compiled[name] = code, seconds
+        return compiled
+
+    def exec_specs(
+        self,
+        specs: dict[str, ModuleSpec],
+        order: Iterable[str],
+        compiled: dict[str, tuple[CodeType | None, float]],
+    ) -> dict[str, M]:
+        """Execute the modules not yet imported in order, returning all of the modules."""
+        timings = self._load_timings
+        timings.clear()
+        for name in order:
+            if name in sys.modules:
+                continue
+            spec = specs[name]
+            start = perf_counter()
+            module = module_from_spec(spec)
+            sys.modules[name] = module
+            try:
+                if spec.loader is not None:
+                    spec.loader.exec_module(module)
+            except BaseException:
+                sys.modules.pop(name, None)
+                raise
+            timings[name] = LoadTiming(compiled.get(name, (None, 0.0))[1], perf_counter() - start)
+        return {name: sys.modules[name] for name in specs}  # type: ignore[misc]
+
     @classmethod
     def load_argv(
         cls,
@@ -490,25 +1101,21 @@ def comment(str: str) -> str:
 
 
 class DefsOnly(ast.NodeTransformer):
-    INCLUDE = (
-        ast.Import,
-        ast.ImportFrom,
-        ast.ClassDef,
-        ast.FunctionDef,
-        ast.AsyncFunctionDef,
-    )
+    """Deprecated, `DefsOnlyStage` keeps only imports and definitions in the pipeline."""
 
-    def visit(self, node: A) -> A:
-        visited: A = super().visit(node)
-        return visited
+    INCLUDE = DefsOnlyStage.INCLUDE
 
-    def visit_Module(self, node: ast.Module) -> ast.Module:
-        args: tuple[Any, ...] = (
-            [x for x in node.body if isinstance(x, self.INCLUDE)],
-            node.type_ignores,
+    def __init__(self) -> None:
+        warnings.warn(
+            "DefsOnly is deprecated, use importnb.transforms.DefsOnlyStage",
+            DeprecationWarning,
+            stacklevel=2,
         )
+        super().__init__()
 
-        return ast.Module(*args)
+    def visit_Module(self, node: ast.Module) -> ast.Module:
+        module = ast.Module(list(node.body), node.type_ignores)
+        return Pipeline([DefsOnlyStage()])(module)
 
 
 class Notebook(Loader[SourceModule]):
@@ -527,11 +1134,6 @@ class Notebook(Loader[SourceModule]):
     def raw(self, str: str) -> str:
         return comment(str)
 
-    def visit(self, nodes: A) -> A:
-        if self.include_non_defs:
-            return nodes
-        return DefsOnly().visit(nodes)
-
     def code(self, str: str) -> str:
         if self.no_magic:
             if MAGIC.match(str):
@@ -541,24 +1143,51 @@ class Notebook(Loader[SourceModule]):
     def source_to_nodes(
         self, source: str, path: str = "<unknown>", *, _optimize: int = -1
     ) -> ast.Module:
-        nodes = super().source_to_nodes(source, path)
-        if self.include_markdown_docstring:
-            nodes = update_docstring(nodes)
-        nodes = self.visit(nodes)
-        return ast.fix_missing_locations(nodes)
+        nodes = super().source_to_nodes(source, path, _optimize=_optimize)
+        # at -OO docstrings are stripped, and markdown is not kept as test strings.
+        level = sys.flags.optimize if _optimize < 0 else _optimize
+        return self.visit(nodes, level)
+
+    def visit(self, nodes: ast.Module, level: int = -1) -> ast.Module:
+        """Transform the ``ast`` of a notebook with the stages of ``get_stages``."""
+        pipeline = Pipeline(self.get_stages(level))
+        nodes = pipeline(nodes)
+        self._stage_timings.update(pipeline.timings)
+        return nodes
 
-    def raw_to_source(self, source: str) -> str:
-        """Transform a string from a raw file to python source."""
-        if self.path and self.path.endswith(".ipynb"):
-            # when we encounter notebooks we apply different transformers to the diff cell types
-            return LineCacheNotebookDecoder(
-                code=self.code,
-                raw=self.raw,
-                markdown=self.markdown,
-            ).decode(source, self.path)
+    def get_stages(self, level: int = -1) -> list[Stage]:
+        """The stages transforming the ``ast`` of a notebook, extended by subclasses with custom stages."""
+        stages: list[Stage] = []
+        if self.include_markdown_docstring:
+            stages.append(MarkdownDocstringStage())
+            if self.get_test_strings_mode(level) == "eager":
+                stages.append(TestStringsStage())
+        if not self.include_non_defs:
+            stages.append(DefsOnlyStage())
+        return stages
 
-        # for a normal file we just apply the code transformer.
-        return self.code(source)
+    @classmethod
+    def stage_info(cls) -> dict[str, float]:
+        """Report the microseconds spent in each ``ast`` stage since the last ``cache_clear``."""
+        return {name: ns / 1000 for name, ns in cls._stage_timings.items()}
+
+    def get_test_strings_mode(self, level: int) -> str:
+        """How markdown test strings are collected at an optimization level."""
+        if self.test_strings not in TEST_STRINGS:
+            raise ValueError(f"{self.test_strings!r} is not one of {TEST_STRINGS}")
+        level = sys.flags.optimize if level < 0 else level
+        if level >= 2 or not self.include_markdown_docstring:
+            return "off"
+        return self.test_strings
+
+    def get_test_strings(self, path: str) -> dict[str, str] | None:
+        """Collect the ``lazy`` markdown ``__test__`` strings of a notebook, or None otherwise."""
+        if self.get_test_strings_mode(self.get_optimization_level()) != "lazy":
+            return None
+        nodes = super().source_to_nodes(self.get_data(path).decode("utf-8"), path)
+        test_strings = TestStringsStage()
+        Pipeline([MarkdownDocstringStage(), test_strings])(nodes)
+        return test_strings.get_strings()
 
 
 def _dict_module(ns: dict[str, str]) -> ModuleType:
@@ -577,16 +1206,33 @@ def main_argv(prog: str, args: list[str] | None = None) -> Iterator[None]:
         sys.argv = prior
 
 
-try:
-    from IPython.core.inputtransformer2 import TransformerManager
+def dedent_magic(body: str) -> str:
+    from textwrap import dedent, indent
+
+    if MAGIC.match(body):
+        return indent(body, "# ")
+    return dedent(body)
+
+
+@cache
+def get_dedent() -> Callable[[str], str]:
+    """The cell transformer, `IPython`'s `TransformerManager` when it is installed.
+
+    `IPython` is slow to import, so it is imported when the first cell is transformed.
+    """
+    try:
+        from IPython.core.inputtransformer2 import TransformerManager
+    except ModuleNotFoundError:
+        return dedent_magic
+    transform: Callable[[str], str] = TransformerManager().transform_cell  # type: ignore[no-untyped-call]
+    return transform
+
 
-    dedent: Callable[[str], str] = TransformerManager().transform_cell  # type: ignore[no-untyped-call]
-    del TransformerManager
-except ModuleNotFoundError:
+@cache
+def get_dedent_engine() -> str:
+    """Name the cell transformer without importing it, for the cache tag."""
+    return "IPython" if find_spec("IPython") else "textwrap"
 
-    def dedent(body: str) -> str:
-        from textwrap import dedent, indent
 
-        if MAGIC.match(body):
-            return indent(body, "# ")
-        return dedent(body)
+def dedent(body: str) -> str:
+    return get_dedent()(body)
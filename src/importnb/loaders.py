@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Any, Protocol
+from io import BytesIO
+from typing import IO, TYPE_CHECKING, Any, Protocol
 
 from .loader import Loader, SourceModule
 
@@ -31,9 +32,16 @@ class DataStreamLoader(Loader[DataModule]):
             assert isinstance(module, DataModule)
             assert module.__file__
 
-        with open(module.__file__, "rb") as file:
+        with self.open_data(module.__file__) as file:
             module.data = self.get_data_loader()(file)
 
+    def open_data(self, path: str) -> IO[bytes]:
+        """Open the raw data of a module, a member of an archive is read to memory."""
+        try:
+            return open(path, "rb")
+        except OSError:
+            return BytesIO(self.read_raw(path))
+
     def get_data_loader(self) -> DataLoaderGetter:
         raise NotImplementedError("load_data not implemented.")
 
@@ -0,0 +1,244 @@
+"""# importing notebooks from a manifest
+
+finding a module on `sys.path` lists and stats directories, which is slow on network volumes.
+`importnb manifest` records the module name, path, size, modified time, content hash and loader
+alias of each notebook in a tree, and `ManifestFinder` resolves imports of those modules by
+looking them up, checking only the `stat` of the file. modules missing from the manifest, or
+changed since it was written, are left to the path finders, like the `FuzzyFinder`. so are
+modules shadowed by a python module of the same name in an earlier entry of the path. the
+directories on the path are listed once, so like other new modules, a new module shadowing the
+manifest is found after `importlib.invalidate_caches()`.
+
+```bash
+importnb manifest src -o importnb-manifest.json
+```
+
+```python
+from importnb.manifest import ManifestFinder
+
+with ManifestFinder.from_file("importnb-manifest.json"):
+    import my_notebook
+```
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from importlib.abc import MetaPathFinder
+from importlib.machinery import PathFinder, all_suffixes
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .compileall import find_files, get_loader_types
+from .finder import FileModuleSpec
+from .tangle import file_digest
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser
+    from collections.abc import Iterable, Sequence
+    from importlib.machinery import ModuleSpec
+    from types import ModuleType
+
+    from .loader import Loader
+
+__all__ = "ManifestFinder", "build_manifest", "main"
+
+#: the version of the manifest format.
+MANIFEST_VERSION = 1
+#: the default file name of a manifest.
+MANIFEST_FILE = "importnb-manifest.json"
+
+
+def get_aliases(data: bool = False) -> dict[str, str]:
+    """The entry point alias of the loader of each extension."""
+    return {extension: extension[1:] for extension in get_loader_types(data)}
+
+
+def build_manifest(
+    roots: Iterable[str | Path], data: bool = False, relative_to: str | Path | None = None
+) -> dict[str, Any]:
+    """Record the notebooks in directories that are on ``sys.path``.
+
+    notebooks beside a python file of the same name are left out, as the python file is imported.
+    paths are written relative to ``relative_to``, the directory of the manifest.
+    """
+    aliases = get_aliases(data)
+    modules: dict[str, dict[str, Any]] = {}
+    for root in map(str, roots):
+        for file in find_files([root], tuple(aliases)):
+            path = Path(file)
+            stem = path.with_suffix("")
+            if path.with_suffix(".py").exists() or stem.is_dir():
+                continue
+            name = ".".join(Path(os.path.relpath(stem, root)).parts)
+            st = path.stat()
+            location = str(path.absolute())
+            if relative_to is not None:
+                try:
+                    location = os.path.relpath(location, relative_to)
+                except ValueError:
+                    # paths on another drive stay absolute
+                    pass
+            modules.setdefault(
+                name,
+                dict(
+                    path=Path(location).as_posix(),
+                    size=st.st_size,
+                    mtime_ns=st.st_mtime_ns,
+                    digest=file_digest(file),
+                    loader=aliases[path.suffix],
+                ),
+            )
+    return dict(version=MANIFEST_VERSION, modules=modules)
+
+
+def _normalize(path: str) -> Path:
+    # ``Path.absolute`` keeps ``..``, and ``Path.resolve`` follows links that ``sys.path`` keeps
+    return Path(os.path.normpath(Path(path).absolute()))
+
+
+class ManifestFinder(MetaPathFinder):
+    """A meta path finder importing the modules of a manifest without searching ``sys.path``.
+
+    ``validate`` checks the size and modified time of a file before it is imported,
+    and its content hash if they have changed.
+    """
+
+    def __init__(
+        self,
+        manifest: dict[str, Any],
+        root: str | Path = ".",
+        *,
+        validate: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"unsupported manifest version {manifest.get('version')!r}")
+        self.modules: dict[str, dict[str, Any]] = manifest["modules"]
+        self.root = str(root)
+        self.validate = validate
+        #: options for the loaders of the modules.
+        self.kwargs = kwargs
+        self._loader_types: dict[str, type[Loader[ModuleType]]] = {}
+        self._listings: dict[Path, frozenset[str]] = {}
+
+    @classmethod
+    def from_file(cls, path: str | Path, **kwargs: Any) -> ManifestFinder:
+        """Read a manifest, with paths relative to its directory."""
+        manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(manifest, Path(path).absolute().parent, **kwargs)
+
+    def get_loader_type(self, alias: str) -> type[Loader[ModuleType]]:
+        loader_type = self._loader_types.get(alias)
+        if loader_type is None:
+            from .entry_points import loader_from_ep
+
+            loader_type = self._loader_types[alias] = loader_from_ep(alias)
+        return loader_type
+
+    def get_path(self, entry: dict[str, Any]) -> str | None:
+        """The path of a module, or ``None`` if its file changed after the manifest was written."""
+        path = Path(self.root, entry["path"])
+        if not self.validate:
+            return str(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        if st.st_size != entry["size"]:
+            return None
+        if st.st_mtime_ns != entry["mtime_ns"] and file_digest(str(path)) != entry["digest"]:
+            return None
+        return str(path)
+
+    def get_listing(self, folder: Path) -> frozenset[str]:
+        """The names in a directory, listed once until ``invalidate_caches``."""
+        listing = self._listings.get(folder)
+        if listing is None:
+            try:
+                listing = frozenset(entry.name for entry in folder.iterdir())
+            except OSError:
+                listing = frozenset()
+            self._listings[folder] = listing
+        return listing
+
+    def has_module(self, folder: Path, name: str, suffixes: Iterable[str]) -> bool:
+        """Whether a directory holds a package, or a file with one of the suffixes, of a name."""
+        listing = self.get_listing(folder)
+        if name in listing and "__init__.py" in self.get_listing(folder / name):
+            return True
+        return any(f"{name}{suffix}" in listing for suffix in suffixes)
+
+    def invalidate_caches(self) -> None:
+        """Forget the listings of the directories on the path."""
+        self._listings.clear()
+
+    def is_shadowed(self, fullname: str, location: str, path: Sequence[str] | None) -> bool:
+        """Whether another module of the name is imported first, from an earlier entry of the path.
+
+        only the files a finder would import are looked for, in the entries of ``sys.path``, or of
+        the package ``path``, up to the directory of the module. a module whose directory is not
+        on the path is never imported from the manifest.
+        """
+        directory = _normalize(str(Path(location).parent))
+        name = fullname.rpartition(".")[2]
+        suffixes = all_suffixes()
+        for entry in sys.path if path is None else path:
+            folder = _normalize(entry)
+            if folder == directory:
+                return self.has_module(folder, name, suffixes)
+            if self.has_module(folder, name, [*suffixes, Path(location).suffix]):
+                return True
+        return True
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Sequence[str] | None = None,
+        target: ModuleType | None = None,
+    ) -> ModuleSpec | None:
+        entry = self.modules.get(fullname)
+        if entry is None:
+            return None
+        location = self.get_path(entry)
+        if location is None or self.is_shadowed(fullname, location, path):
+            return None
+        loader = self.get_loader_type(entry["loader"])(fullname, location, **self.kwargs)
+        return FileModuleSpec(fullname, loader, origin=location)
+
+    def __enter__(self) -> ManifestFinder:
+        """Find modules before the path finder, after the finders of builtin and frozen modules."""
+        meta_path = sys.meta_path
+        index = meta_path.index(PathFinder) if PathFinder in meta_path else len(meta_path)
+        meta_path.insert(index, self)
+        return self
+
+    def __exit__(self, *excepts: object) -> None:
+        """Stop finding modules from the manifest."""
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+
+def get_argparser() -> ArgumentParser:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        "importnb manifest", description="record the notebooks in directories on sys.path"
+    )
+    parser.add_argument("roots", nargs="+", help="directories on sys.path")
+    parser.add_argument("-o", "--output", default=MANIFEST_FILE, help="the manifest file")
+    parser.add_argument("--data", action="store_true", help="record data modules too")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Write a manifest from the command line."""
+    ns = get_argparser().parse_args(argv)
+    output = Path(ns.output).absolute()
+    manifest = build_manifest(ns.roots, ns.data, relative_to=output.parent)
+    with output.open("w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    print(f"wrote {len(manifest['modules'])} modules to {ns.output}")
+    return 0
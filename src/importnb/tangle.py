@@ -0,0 +1,243 @@
+"""# tangling notebooks to python files
+
+`importnb tangle` writes the python source of a notebook to a `.py` file beside it, so a
+deployment imports plain python through python's own `SourceFileLoader` and `.pyc` cache,
+and never decodes a notebook.
+
+the tangled source is line-aligned with the notebook. statements the `ast` stages remove are
+blanked, and the statements they add, like markdown docstrings and `__test__` strings, follow the
+last line of the notebook. the file ends with a `SourceMap` comment naming the notebook, the hash
+of its content, and the line each cell starts on.
+
+```bash
+importnb tangle notebooks
+```
+
+while a `Notebook` finder is installed, an up to date tangled file is imported with its code and
+tracebacks pointing into the notebook, and a stale one is ignored in favor of the notebook.
+"""
+
+from __future__ import annotations
+
+import ast
+import json
+import os
+import sys
+import tempfile
+from _imp import _fix_co_filename  # type: ignore[attr-defined]
+from bisect import bisect_right
+from functools import partial
+from hashlib import sha256
+from importlib.machinery import SourceFileLoader
+from importlib.util import LazyLoader
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .compileall import add_loader_arguments, find_files, get_file_errors, get_loader_options
+from .decoder import update_linecache
+from .docstrings import docstring_ast_types, str_expr
+from .loader import Loader, Notebook
+from .transforms import Pipeline
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser
+    from types import CodeType, ModuleType
+
+__all__ = "SourceMap", "TangledLoader", "main", "tangle_file"
+
+
+class SourceMap:
+    """The notebook of a tangled file, and the line that each of its cells starts on."""
+
+    prefix = "# importnb:tangled"
+    #: the size of the end of a file read to find its map.
+    tail = 1 << 16
+
+    def __init__(self, notebook: str, digest: str, tag: str, cells: list[tuple[int, int]]) -> None:
+        self.notebook = notebook
+        self.digest = digest
+        self.tag = tag
+        #: the python line and notebook index of each cell, in order.
+        self.cells = cells
+
+    def __call__(self, lineno: int) -> tuple[int, int] | None:
+        """Map a line of the tangled file to a cell, and a line of that cell counted from 1."""
+        i = bisect_right(self.cells, (lineno, sys.maxsize)) - 1
+        if i < 0:
+            return None
+        start, cell = self.cells[i]
+        return cell, lineno - start + 1
+
+    def dumps(self) -> str:
+        data = dict(notebook=self.notebook, digest=self.digest, tag=self.tag, cells=self.cells)
+        return f"{self.prefix} {json.dumps(data, separators=(',', ':'))}\n"
+
+    @classmethod
+    def loads(cls, line: str) -> SourceMap | None:
+        if not line.startswith(cls.prefix):
+            return None
+        try:
+            data = json.loads(line[len(cls.prefix) :])
+            cells = [(int(start), int(cell)) for start, cell in data["cells"]]
+            return cls(data["notebook"], data["digest"], data["tag"], cells)
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def read(cls, path: str) -> SourceMap | None:
+        """Read the map ending a tangled file, without reading the rest of a large file."""
+        try:
+            with open(path, "rb") as file:
+                size = file.seek(0, os.SEEK_END)
+                file.seek(max(0, size - cls.tail))
+                data = file.read()
+                if size > cls.tail and b"\n" not in data.rstrip(b"\n"):
+                    file.seek(0)
+                    data = file.read()
+        except OSError:
+            return None
+        line = data.rstrip(b"\n").rpartition(b"\n")[2]
+        return cls.loads(line.decode("utf-8", "replace"))
+
+
+def file_digest(path: str) -> str:
+    return sha256(Path(path).read_bytes()).hexdigest()
+
+
+def get_tangle_loader(loader: Loader[Any]) -> Loader[Any]:
+    """A copy of a loader making line-aligned source, the only source that can be tangled."""
+    params = loader.get_options()
+    params["compact"] = False
+    return type(loader)(**params)
+
+
+def get_tail(loader: Loader[Any], nodes: ast.Module) -> tuple[set[int], list[str]]:
+    """Find the lines the ``ast`` stages of a loader remove, and the statements they add.
+
+    markdown docstrings are added by assigning ``__doc__`` after the notebook.
+    """
+    get_stages = getattr(loader, "get_stages", None)
+    stages = get_stages(loader.get_optimization_level()) if get_stages else []
+    before = list(nodes.body)
+    after = Pipeline(stages)(ast.Module(body=list(before), type_ignores=[])).body
+    kept = {id(node) for node in after} & {id(node) for node in before}
+    tail: list[str] = []
+    for node in after:
+        if id(node) in kept:
+            continue
+        if isinstance(node, docstring_ast_types):
+            same = (x for x in before if type(x) is type(node) and x.lineno == node.lineno)
+            original = next(same, None)
+            if original is not None:
+                # a copy of a definition with a markdown docstring
+                kept.add(id(original))
+                if str_expr(node.body[0]):
+                    doc = node.body[0].value.value  # type: ignore[attr-defined]
+                    tail.append(f"{node.name}.__doc__ = {doc!r}")
+                continue
+        tail.append(ast.unparse(node))
+    blank: set[int] = set()
+    lines: set[int] = set()
+    for node in before:
+        span = range(node.lineno, (node.end_lineno or node.lineno) + 1)
+        (lines if id(node) in kept else blank).update(span)
+    # statements sharing a line with a kept statement can't be removed
+    return blank - lines, tail
+
+
+def tangle_file(path: str | Path, loader_type: type[Loader[Any]] = Notebook, **kwargs: Any) -> str:
+    """Write the python source of a notebook beside it, returning the path of the python file.
+
+    raises ``FileExistsError`` rather than replace a python file that was not tangled.
+    """
+    path = str(path)
+    target = Path(path).with_suffix(".py")
+    if target.exists() and SourceMap.read(str(target)) is None:
+        raise FileExistsError(f"{target} is not a tangled file, and is not replaced")
+    loader = get_tangle_loader(loader_type(target.stem, path, **kwargs))
+    raw = Path(path).read_bytes()
+    decoder = loader.get_decoder()
+    source = decoder.decode(raw.decode("utf-8"), path)
+    blank, tail = get_tail(loader, Loader.source_to_nodes(loader, source, path))
+
+    lines = source.splitlines()
+    for lineno in blank:
+        lines[lineno - 1] = ""
+    source_map = SourceMap(
+        Path(path).name,
+        sha256(raw).hexdigest(),
+        loader.get_cache_tag(),
+        [(start, cell) for (start, _), cell in zip(decoder.spans, decoder.span_cells)],
+    )
+    tangled = "\n".join([*lines, *tail, source_map.dumps()])
+
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=target.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(tangled)
+        Path(tmp).replace(target)
+    except BaseException:
+        Path(tmp).unlink()
+        raise
+    return str(target)
+
+
+def is_fresh(source_map: SourceMap, path: str, notebook: str, loader: Loader[Any]) -> bool:
+    """A tangled file is fresh if the notebook is unchanged, and the loader options are the same."""
+    if isinstance(loader, LazyLoader):
+        loader = loader.loader
+    if source_map.tag != get_tangle_loader(loader).get_cache_tag():
+        return False
+    try:
+        if Path(notebook).stat().st_mtime_ns <= Path(path).stat().st_mtime_ns:
+            return True
+        # checkouts and copies change the modified time, so the content is compared
+        return file_digest(notebook) == source_map.digest
+    except OSError:
+        return False
+
+
+class TangledLoader(SourceFileLoader):
+    """Import the tangled python file of a notebook, as though its code came from the notebook."""
+
+    def __init__(self, fullname: str, path: str, notebook: str) -> None:
+        super().__init__(fullname, path)
+        self.notebook = notebook
+
+    def get_code(self, fullname: str) -> CodeType | None:
+        code = super().get_code(fullname)
+        if code is not None:
+            _fix_co_filename(code, self.notebook)
+        return code
+
+    def exec_module(self, module: ModuleType) -> None:
+        # tracebacks into the notebook show the lines of the tangled file
+        update_linecache(self.notebook, partial(self.get_source, self.name))
+        super().exec_module(module)
+
+
+def get_argparser() -> ArgumentParser:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser("importnb tangle", description="write notebooks as python files")
+    parser.add_argument("paths", nargs="+", help="notebooks and directories to tangle")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    add_loader_arguments(parser)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Tangle notebooks from the command line, the return code is ``1`` if any failed."""
+    ns = get_argparser().parse_args(argv)
+    options = get_loader_options(ns)
+    failed = 0
+    for path in find_files(ns.paths, (".ipynb",)):
+        try:
+            target = tangle_file(path, **options)
+        except get_file_errors() as error:
+            failed += 1
+            print(f"failed {path}: {type(error).__name__}: {error}", file=sys.stderr)
+        else:
+            if not ns.quiet:
+                print(f"{path} -> {target}")
+    return 1 if failed else 0
@@ -0,0 +1,192 @@
+"""# a single pass `ast` pipeline
+
+notebooks are transformed by stages that each see the top-level statements of a module in turn.
+the statements are walked once, however many stages there are, and only the nodes a stage adds
+get missing locations filled in, rather than the whole tree.
+
+a stage may keep state between statements, replace a statement with any number of statements,
+and add statements after the last one. stages must not modify the nodes they are given, which
+may be shared with cached cells, but copy them instead. `Pipeline` records the time spent in
+each stage.
+
+```python
+>>> import ast
+>>> from importnb import Notebook
+>>> from importnb.transforms import Stage
+>>> class NoPass(Stage):
+...     name = "no-pass"
+...
+...     def visit(self, node):
+...         return [] if isinstance(node, ast.Pass) else [node]
+>>> class Custom(Notebook):
+...     def get_stages(self, level=-1):
+...         return [*super().get_stages(level), NoPass()]
+>>> print(ast.unparse(Custom().visit(ast.parse("pass; x = 1"))))
+x = 1
+
+```
+"""
+
+from __future__ import annotations
+
+import ast
+from collections import Counter
+from copy import copy
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, ClassVar
+
+from .docstrings import create_test, docstring_ast_types, str_expr, test_update
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Sequence
+
+__all__ = "DefsOnlyStage", "MarkdownDocstringStage", "Pipeline", "Stage", "TestStringsStage"
+
+
+class Stage:
+    """a step of the `Pipeline`, a new stage is created for each module."""
+
+    name: ClassVar[str] = "stage"
+
+    def visit(self, node: ast.stmt) -> Iterable[ast.stmt]:
+        """Transform a top-level statement to any number of statements."""
+        return (node,)
+
+    def finish(self) -> Iterable[ast.stmt]:
+        """Statements added after the last statement of the module."""
+        return ()
+
+
+class MarkdownDocstringStage(Stage):
+    """markdown blocks preceding a `class` or `def` become docstrings."""
+
+    name = "markdown-docstring"
+
+    def __init__(self) -> None:
+        self.seen = 0
+        self.held: ast.stmt | None = None
+
+    def visit(self, node: ast.stmt) -> Iterable[ast.stmt]:
+        held, self.held = self.held, None
+        self.seen += 1
+        if held is not None:
+            if isinstance(node, docstring_ast_types) and not str_expr(node.body[0]):
+                # a copy keeps cached nodes unchanged
+                node = copy(node)
+                node.body = [held, *node.body]
+                return (node,)
+            if str_expr(node):
+                self.held = node
+                return (held,)
+            return held, node
+        # the first statement is the module docstring, and is never moved
+        if self.seen > 1 and str_expr(node):
+            self.held = node
+            return ()
+        return (node,)
+
+    def finish(self) -> Iterable[ast.stmt]:
+        return () if self.held is None else (self.held,)
+
+
+class TestStringsStage(Stage):
+    """strings are collected in a module-level `__test__` dictionary for `doctest`.
+
+    the leading string of the module, and of each body, is a docstring and is not collected.
+    """
+
+    name = "test-strings"
+
+    def __init__(self) -> None:
+        self.strings: list[ast.Constant] = []
+        self.seen = 0
+
+    def visit(self, node: ast.stmt) -> Iterable[ast.stmt]:
+        self.seen += 1
+        if self.seen > 1 or not str_expr(node):
+            self.collect(node)
+        return (node,)
+
+    def collect(self, node: ast.AST) -> None:
+        if str_expr(node):
+            value = node.value.value  # type: ignore[attr-defined]
+            if isinstance(value, str):
+                self.strings.append(
+                    ast.copy_location(ast.Constant(value.replace("\n```", "\n")), node)
+                )
+        elif hasattr(node, "body"):
+            body: list[ast.stmt] = node.body
+            for child in body[1:] if body and str_expr(body[0]) else body:
+                self.collect(child)
+        elif isinstance(node, ast.stmt):
+            # statements without a body, like `match`, hold their statements deeper down
+            for part in ast.iter_child_nodes(node):
+                if not isinstance(part, ast.expr):
+                    self.collect(part)
+
+    def finish(self) -> Iterable[ast.stmt]:
+        if not self.strings:
+            return ()
+        return create_test, *(
+            ast.fix_missing_locations(
+                ast.copy_location(
+                    ast.Expr(
+                        ast.Call(
+                            func=test_update,
+                            args=[
+                                ast.Dict(
+                                    keys=[ast.Constant(f"string-{node.lineno}")], values=[node]
+                                )
+                            ],
+                            keywords=[],
+                        )
+                    ),
+                    node,
+                )
+            )
+            for node in self.strings
+        )
+
+    def get_strings(self) -> dict[str, Any]:
+        return {f"string-{node.lineno}": node.value for node in self.strings}
+
+
+class DefsOnlyStage(Stage):
+    """only imports, and function and class definitions are kept."""
+
+    name = "defs-only"
+    INCLUDE = (ast.Import, ast.ImportFrom, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+
+    def visit(self, node: ast.stmt) -> Iterable[ast.stmt]:
+        return (node,) if isinstance(node, self.INCLUDE) else ()
+
+
+class Pipeline:
+    """run stages over the top-level statements of a module in one pass."""
+
+    def __init__(self, stages: Sequence[Stage]) -> None:
+        self.stages = stages
+        #: the nanoseconds spent in each stage.
+        self.timings: Counter[str] = Counter()
+
+    def __call__(self, module: ast.Module) -> ast.Module:
+        body: list[ast.stmt] = []
+        for node in module.body:
+            body.extend(self.visit([node], 0))
+        for i, stage in enumerate(self.stages):
+            start = perf_counter_ns()
+            tail = list(stage.finish())
+            self.timings[stage.name] += perf_counter_ns() - start
+            body.extend(self.visit(tail, i + 1))
+        module.body = body
+        return module
+
+    def visit(self, nodes: list[ast.stmt], start: int) -> list[ast.stmt]:
+        """Pass statements through the stages from ``start`` on."""
+        for stage in self.stages[start:]:
+            if not nodes:
+                break
+            begin = perf_counter_ns()
+            nodes = [out for node in nodes for out in stage.visit(node)]
+            self.timings[stage.name] += perf_counter_ns() - begin
+        return nodes
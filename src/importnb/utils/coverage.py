@@ -5,7 +5,6 @@ from typing import TYPE_CHECKING, Any
 
 from coverage.plugin import CoveragePlugin, FileReporter, FileTracer
 
-from importnb.decoder import LineCacheNotebookDecoder
 from importnb.loader import Notebook
 
 if TYPE_CHECKING:
@@ -50,9 +49,7 @@ class NotebookTracer(FileTracer):
 
 class NotebookReporter(FileReporter):
     def source(self) -> str:
-        nb = Notebook(lazy=True)
-        dec = LineCacheNotebookDecoder(code=nb.code, raw=nb.raw, markdown=nb.markdown)
-        return dec.decode(super().source(), self.filename)
+        return Notebook(path=self.filename, lazy=True).get_data(self.filename).decode("utf-8")
 
     def lines(self) -> set[int]:
         in_comment = False